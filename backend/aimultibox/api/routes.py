@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
 """全局路由"""
 
+import secrets
 from typing import Any
-from fastapi import APIRouter, Request
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette import status as HTTP
 from aimultibox import APP_META
 from aimultibox.core.config import settings
 from aimultibox.core.loader import ToolLoader
 from aimultibox.core.sse import sse_manager
+from aimultibox.core.timing import stage_metrics
 from aimultibox.auth.api import router as auth_router
 from aimultibox.auth.utils import get_client_id, get_user_id
 from aimultibox.schemas import AppInfoResponse, ToolListResponse
@@ -52,3 +55,15 @@ async def sse_stream(
             "X-Accel-Buffering": "no",
         },
     )
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics(request: Request) -> PlainTextResponse:
+    """阶段耗时直方图（Prometheus 抓取）"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=HTTP.HTTP_404_NOT_FOUND, detail="Not Found")
+    if settings.metrics_token:
+        expected = f"Bearer {settings.metrics_token}"
+        if not secrets.compare_digest(request.headers.get("authorization", ""), expected):
+            raise HTTPException(status_code=HTTP.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    return PlainTextResponse(stage_metrics.render(), media_type="text/plain; version=0.0.4")
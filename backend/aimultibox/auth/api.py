@@ -8,7 +8,7 @@ from pydantic import BaseModel
 from aimultibox.core.config import settings
 from aimultibox.auth import repo as auth_repo
 from aimultibox.auth.service import verify_google_token, create_session, delete_session, get_user_by_session, AuthError
-from aimultibox.tools.currency_manager.repo import merge_client_to_user
+from aimultibox.tools.currency_manager.repo import merge_client_to_user_async
 from aimultibox.auth.schemas import UserResponse
 from aimultibox.schemas import OkResponse
 from starlette import status as HTTP
@@ -64,7 +64,7 @@ async def login_with_google(payload: GoogleAuthRequest, request: Request, respon
     if not token_info.get("sub"):
         raise HTTPException(status_code=HTTP.HTTP_401_UNAUTHORIZED, detail="Google Token 无效")
 
-    user = auth_repo.get_or_create_user_from_identity(
+    user = await auth_repo.get_or_create_user_from_identity_async(
         provider="google",
         subject=token_info.get("sub"),
         email=token_info.get("email"),
@@ -74,10 +74,10 @@ async def login_with_google(payload: GoogleAuthRequest, request: Request, respon
 
     client_id = getattr(request.state, "client_id", None)
     if client_id and user:
-        auth_repo.link_client_to_user(client_id, user["id"])
-        merge_client_to_user(client_id, user["id"])
+        await auth_repo.link_client_to_user_async(client_id, user["id"])
+        await merge_client_to_user_async(client_id, user["id"])
 
-    session_id, _ = create_session(user["id"])
+    session_id, _ = await create_session(user["id"])
     _set_session_cookie(response, session_id)
 
     return {
@@ -89,7 +89,7 @@ async def login_with_google(payload: GoogleAuthRequest, request: Request, respon
 async def get_me(request: Request) -> dict[str, Any]:
     """获取当前登录状态"""
     session_id = request.cookies.get(settings.auth_cookie_name)
-    user = get_user_by_session(session_id) if session_id else None
+    user = await get_user_by_session(session_id) if session_id else None
     return {"user": _serialize_user(user)}
 
 
@@ -98,6 +98,6 @@ async def logout(request: Request, response: Response) -> dict[str, Any]:
     """退出登录"""
     session_id = request.cookies.get(settings.auth_cookie_name)
     if session_id:
-        delete_session(session_id)
+        await delete_session(session_id)
     _clear_session_cookie(response)
     return {"ok": True}
@@ -9,7 +9,7 @@ from typing import Optional
 
 from sqlalchemy import select, delete
 
-from aimultibox.db import session_scope
+from aimultibox.db import session_scope, to_async
 from aimultibox.auth.models import User, UserIdentity, Client, Session
 
 
@@ -164,3 +164,13 @@ def _to_user_dict(user: Optional[User]) -> Optional[dict]:
         "email": user.email,
         "avatar_url": user.avatar_url,
     }
+
+
+# ==================== 异步版本（数据库线程池执行） ====================
+
+upsert_client_async = to_async(upsert_client)
+link_client_to_user_async = to_async(link_client_to_user)
+get_or_create_user_from_identity_async = to_async(get_or_create_user_from_identity)
+create_session_async = to_async(create_session)
+get_user_by_session_async = to_async(get_user_by_session)
+delete_session_async = to_async(delete_session)
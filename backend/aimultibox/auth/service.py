@@ -44,16 +44,16 @@ async def verify_google_token(id_token: str) -> dict:
     }
 
 
-def create_session(user_id: str) -> tuple[str, datetime]:
+async def create_session(user_id: str) -> tuple[str, datetime]:
     """创建会话"""
-    return auth_repo.create_session(user_id, settings.auth_session_days)
+    return await auth_repo.create_session_async(user_id, settings.auth_session_days)
 
 
-def get_user_by_session(session_id: str) -> Optional[dict]:
+async def get_user_by_session(session_id: str) -> Optional[dict]:
     """通过会话获取用户"""
-    return auth_repo.get_user_by_session(session_id)
+    return await auth_repo.get_user_by_session_async(session_id)
 
 
-def delete_session(session_id: str) -> None:
+async def delete_session(session_id: str) -> None:
     """删除会话"""
-    auth_repo.delete_session(session_id)
+    await auth_repo.delete_session_async(session_id)
@@ -16,7 +16,10 @@ HTTP_CODE_MAP: dict[int, ErrorCode] = {
     HTTP.HTTP_403_FORBIDDEN: ErrorCode.FORBIDDEN,
     HTTP.HTTP_404_NOT_FOUND: ErrorCode.NOT_FOUND,
     HTTP.HTTP_405_METHOD_NOT_ALLOWED: ErrorCode.METHOD_NOT_ALLOWED,
+    HTTP.HTTP_409_CONFLICT: ErrorCode.CONFLICT,
+    HTTP.HTTP_413_CONTENT_TOO_LARGE: ErrorCode.PAYLOAD_TOO_LARGE,
     HTTP.HTTP_500_INTERNAL_SERVER_ERROR: ErrorCode.INTERNAL_ERROR,
+    HTTP.HTTP_503_SERVICE_UNAVAILABLE: ErrorCode.SERVICE_UNAVAILABLE,
 }
 
 
@@ -38,6 +38,12 @@ class AIMode(str, Enum):
     CLOUD = "cloud"  # 云端 SDXL Inpainting
 
 
+class WatermarkBackend(str, Enum):
+    """去水印推理后端"""
+    INLINE = "inline"    # API 进程内推理
+    PROCESS = "process"  # 独立进程池推理
+
+
 class Settings(BaseSettings):
     """
     运行时配置
@@ -80,9 +86,67 @@ class Settings(BaseSettings):
 
     # 数据库
     database_url: str = f"sqlite:///{(BASE_DIR / 'data' / 'aimultibox.db').as_posix()}"
+    database_threads: int = 4  # 数据库线程池大小（异步路由中的同步查询在此执行，不超过连接池大小）
+    sqlite_journal_mode: str = "wal"  # WAL 下读写互不阻塞：wal / delete / truncate / persist / memory / off
+    sqlite_synchronous: str = "normal"  # WAL 下 normal 仅在检查点时 fsync：off / normal / full / extra
+    sqlite_busy_timeout_ms: int = 5000  # 数据库被锁时的等待时间（毫秒）
+    sqlite_mmap_size: int = 256 * 1024 * 1024  # 内存映射读取上限（字节，0 禁用）
+    sqlite_cache_size_kb: int = 16 * 1024  # 每个连接的页缓存大小（KiB）
+    sqlite_checkpoint_interval: int = 300  # WAL 定期检查点间隔（秒，0 禁用）
+
+    # 云端推理（Replicate）
+    replicate_base_url: str = "https://api.replicate.com/v1"
+    replicate_wait_seconds: int = 30  # 创建预测时 Prefer: wait 的同步等待时间（秒，0 为直接轮询，最大 60）
+    replicate_timeout: int = 90  # 单次预测的最长等待时间（秒）
+    replicate_max_connections: int = 10  # 连接池大小
+
+    # 监控
+    metrics_enabled: bool = False  # 暴露 {api_prefix}/metrics（各阶段耗时直方图，Prometheus 文本格式）
+    metrics_token: str = ""  # 非空时 /metrics 需携带 Authorization: Bearer <token>
 
     # 安全
-    max_upload_size: int = 10 * 1024 * 1024  # 10MB
+    max_upload_size: int = 10 * 1024 * 1024  # 单个上传文件上限 10MB
+    max_request_size: int = 21 * 1024 * 1024  # 请求体上限（图片 + 遮罩两个文件及表单开销，解析表单前检查，0 不限制）
+
+    # 去水印推理
+    watermark_max_image_pixels: int = 40_000_000  # 单张图片最大像素数（超出返回 413）
+    watermark_jpeg_draft: bool = True  # 云端模式下 JPEG 按目标尺寸降采样解码
+    watermark_backend: str = WatermarkBackend.INLINE.value
+    watermark_workers: int = 2  # 进程池 worker 数（process 后端）
+    watermark_worker_threads: int = 2  # 每个 worker 的推理线程数（process 后端）
+    watermark_queue_depth: int = 8  # 最大排队请求数，超出返回 503（process 后端）
+    watermark_batch_size: int = 4  # 微批最大 batch 数
+    watermark_batch_wait_ms: int = 5  # 微批最大等待时间（毫秒）
+    watermark_ocr_concurrency: int = 1  # EasyOCR 检测并发数（独立线程池）
+    watermark_model_variant: str = "fp32"  # LaMa 模型变体：fp32 / fp16 / int8 / auto（达标的最快变体）
+    watermark_variant_min_psnr: float = 30.0  # auto 选择时相对 fp32 的最低 PSNR（dB）
+    watermark_ort_intra_threads: int = 0  # 单个推理的算子内线程数（0 为 onnxruntime 默认，即物理核数）
+    watermark_ort_inter_threads: int = 0  # 算子间线程数（仅 parallel 模式生效）
+    watermark_ort_execution_mode: str = "sequential"  # sequential / parallel
+    watermark_ort_mem_arena: bool = True  # CPU 内存池
+    watermark_ort_mem_pattern: bool = True  # 按固定输入形状预规划内存
+    watermark_ort_allow_spinning: bool = True  # 线程空闲自旋（多进程部署建议关闭）
+    watermark_ort_cache_optimized: bool = False  # 优化后的图缓存到 models/optimized（与本机硬件相关），加快重启
+    watermark_ort_io_binding: bool = False  # 使用 IOBinding 执行推理
+    watermark_job_workers: int = 1  # 异步任务并发处理数
+    watermark_job_queue_size: int = 32  # 异步任务最大排队数，超出返回 503
+    watermark_job_ttl: int = 600  # 已完成任务的状态与结果保留时间（秒）
+    watermark_job_max_stored: int = 128  # 最多保留的已完成任务数（排队 / 处理中的任务不计入）
+    watermark_job_max_result_bytes: int = 256 * 1024 * 1024  # 已完成任务结果占用的内存上限，超出时淘汰最早完成的任务
+    watermark_fallback_scale: float = 0.5  # OpenCV 回退修复的分辨率比例（1 为原分辨率，越小越快）
+    watermark_fallback_radius: int = 3  # OpenCV 回退修复半径（像素，按缩小后的分辨率）
+    watermark_warmup: bool = True  # 启动时后台预热模型（关闭则首次请求时加载）
+    watermark_cache_max_bytes: int = 64 * 1024 * 1024  # 结果缓存内存上限（0 禁用）
+    watermark_cache_disk: bool = False  # 启用磁盘缓存层（data/watermark_cache）
+    watermark_cache_disk_max_bytes: int = 512 * 1024 * 1024  # 磁盘缓存上限
+    watermark_detect_cache_size: int = 256  # 检测结果缓存条数（0 禁用）
+    watermark_detect_cache_ttl: int = 600  # 检测结果缓存有效期（秒）
+    watermark_detect_phash: bool = False  # 用感知哈希匹配重新编码的同一图片（命中后再比对缩略图确认）
+    watermark_output_format: str = "png"  # 默认输出格式：png / webp / jpeg / auto（与输入一致）
+    watermark_png_compress_level: int = 1  # PNG zlib 压缩等级（0-9，越低越快）
+    watermark_jpeg_quality: int = 92
+    watermark_webp_quality: int = 90  # WebP 有损质量
+    watermark_webp_lossless: bool = True  # 未指定 quality 时 WebP 使用无损
 
     # 认证
     auth_session_days: int = 30
@@ -126,6 +190,61 @@ class Settings(BaseSettings):
             raise ValueError(f"ai_mode must be one of {allowed}")
         return v
 
+    @field_validator("watermark_backend")
+    @classmethod
+    def validate_watermark_backend(cls, v: str) -> str:
+        allowed = {e.value for e in WatermarkBackend}
+        if v not in allowed:
+            raise ValueError(f"watermark_backend must be one of {allowed}")
+        return v
+
+    @field_validator("watermark_output_format")
+    @classmethod
+    def validate_watermark_output_format(cls, v: str) -> str:
+        allowed = {"png", "webp", "jpeg", "auto"}
+        if v.lower() not in allowed:
+            raise ValueError(f"watermark_output_format must be one of {allowed}")
+        return v.lower()
+
+    @field_validator("watermark_ort_execution_mode")
+    @classmethod
+    def validate_watermark_ort_execution_mode(cls, v: str) -> str:
+        allowed = {"sequential", "parallel"}
+        if v.lower() not in allowed:
+            raise ValueError(f"watermark_ort_execution_mode must be one of {allowed}")
+        return v.lower()
+
+    @field_validator("watermark_fallback_scale")
+    @classmethod
+    def validate_watermark_fallback_scale(cls, v: float) -> float:
+        if not 0 < v <= 1:
+            raise ValueError("watermark_fallback_scale must be in (0, 1]")
+        return v
+
+    @field_validator("watermark_model_variant")
+    @classmethod
+    def validate_watermark_model_variant(cls, v: str) -> str:
+        allowed = {"fp32", "fp16", "int8", "auto"}
+        if v.lower() not in allowed:
+            raise ValueError(f"watermark_model_variant must be one of {allowed}")
+        return v.lower()
+
+    @field_validator("sqlite_journal_mode")
+    @classmethod
+    def validate_sqlite_journal_mode(cls, v: str) -> str:
+        allowed = {"wal", "delete", "truncate", "persist", "memory", "off"}
+        if v.lower() not in allowed:
+            raise ValueError(f"sqlite_journal_mode must be one of {allowed}")
+        return v.lower()
+
+    @field_validator("sqlite_synchronous")
+    @classmethod
+    def validate_sqlite_synchronous(cls, v: str) -> str:
+        allowed = {"off", "normal", "full", "extra"}
+        if v.lower() not in allowed:
+            raise ValueError(f"sqlite_synchronous must be one of {allowed}")
+        return v.lower()
+
     @field_validator("auth_cookie_samesite")
     @classmethod
     def validate_samesite(cls, v: str) -> str:
@@ -157,7 +276,7 @@ class Settings(BaseSettings):
 
     def log_config_summary(self, logger: logging.Logger) -> None:
         """输出配置摘要（脱敏）"""
-        logger.info(f"环境: {self.app_env} | 调试: {self.debug} | AI: {self.ai_mode}")
+        logger.info(f"环境: {self.app_env} | 调试: {self.debug} | AI: {self.ai_mode} | 去水印后端: {self.watermark_backend}")
         logger.info(f"Google 登录: {'已启用' if self.google_client_id else '未配置'}")
         logger.info(f"云端模式: {'已启用' if self.replicate_api_token else '未配置'}")
 
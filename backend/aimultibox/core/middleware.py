@@ -5,14 +5,16 @@ import time
 import uuid
 import logging
 from typing import Callable
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from aimultibox.core.config import settings
+from aimultibox.core.timing import StageTimer, stage_metrics
 from aimultibox.common.enums import ErrorCode
 from aimultibox.common.errors import error_response, error_code_from_status
 from starlette import status as HTTP
-from aimultibox.auth.repo import upsert_client, get_user_by_session
+from aimultibox.auth.repo import upsert_client_async, get_user_by_session_async
 from aimultibox.db import set_scope, reset_scope
 
 logging.basicConfig(
@@ -42,9 +44,9 @@ class RequestLogMiddleware(BaseHTTPMiddleware):
         tokens = None
         try:
             session_id = request.cookies.get(settings.auth_cookie_name)
-            user = get_user_by_session(session_id) if session_id else None
+            user = await get_user_by_session_async(session_id) if session_id else None
             request.state.user_id = user.get("id") if user else None
-            upsert_client(client_id, request.state.user_id)
+            await upsert_client_async(client_id, request.state.user_id)
             tokens = set_scope(request.state.user_id, client_id)
         except Exception as e:
             logger.warning(f"[{request_id}] 认证解析失败: {e}")
@@ -60,6 +62,10 @@ class RequestLogMiddleware(BaseHTTPMiddleware):
 
         client_ip = request.client.host if request.client else "unknown"
 
+        # 分阶段计时（业务代码通过 timing.stage 记录；在会话 / 客户端查询之后启用，不计入其耗时）
+        timer = StageTimer()
+        timer_token = timer.activate()
+
         try:
             response = await call_next(request)
 
@@ -69,6 +75,15 @@ class RequestLogMiddleware(BaseHTTPMiddleware):
             log_level = logging.INFO if status_code < 400 else logging.WARNING
             logger.log(log_level, f"[{request_id}] {method} {path} {status_code} | {duration:.1f}ms | {client_ip}")
 
+            stage_metrics.observe_timer(timer)
+            # 只有数据库阶段的普通接口（汇率、认证等）不输出阶段日志和 Server-Timing
+            if timer.stages.keys() - {"db"}:
+                logger.info(
+                    f"[{request_id}] stages | {timer.summary()}",
+                    extra={"request_id": request_id, "path": request.url.path, "stages": dict(timer.stages)},
+                )
+                response.headers["Server-Timing"] = timer.server_timing()
+
             response.headers["X-Request-ID"] = request_id
             response.set_cookie(
                 key=settings.client_id_cookie_name,
@@ -85,10 +100,56 @@ class RequestLogMiddleware(BaseHTTPMiddleware):
             logger.error(f"[{request_id}] {method} {path} 500 | {duration:.1f}ms | {client_ip} | {str(e)}")
             raise
         finally:
+            timer.deactivate(timer_token)
             if tokens:
                 reset_scope(tokens)
 
 
+class BodySizeLimitMiddleware:
+    """
+    请求体大小限制（纯 ASGI 中间件）
+
+    表单在进入路由前就会被完整读取并落盘，路由内的分块读取无法限制内存 / 磁盘占用，
+    因此在解析前拒绝：Content-Length 超限直接返回 413；未声明长度（chunked）时按已接收字节数计，
+    超限时在读取请求体的过程中抛出 413
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int) -> None:
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(
+            status_code=HTTP.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"请求体过大，最大 {self.max_bytes // (1024 * 1024)}MB",
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            exc = self._too_large()
+            response = error_response(ErrorCode.PAYLOAD_TOO_LARGE, exc.detail, exc.status_code)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise self._too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
 class APIException(Exception):
     """API 异常"""
 
@@ -208,8 +269,10 @@ class ExceptionHandlers:
         request_id = getattr(request.state, 'request_id', 'unknown')
 
         details = None
+        headers = None
         if isinstance(exc, HTTPException):
             status_code = exc.status_code
+            headers = exc.headers
             if isinstance(exc.detail, (dict, list)):
                 details = exc.detail
                 message = "请求错误"
@@ -228,6 +291,7 @@ class ExceptionHandlers:
             message,
             status_code,
             details if details is not None else None,
+            headers=headers,
         )
         return ExceptionHandlers._attach_ids(response, request)
 
@@ -251,6 +315,7 @@ def setup_middleware(app: FastAPI) -> None:
     from pydantic import ValidationError
     from fastapi.exceptions import ResponseValidationError
 
+    app.add_middleware(BodySizeLimitMiddleware, max_bytes=settings.max_request_size)
     app.add_middleware(RequestLogMiddleware)
 
     app.add_exception_handler(APIException, ExceptionHandlers.api_exception_handler)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+请求分阶段计时
+
+- StageTimer: 单个请求的各阶段耗时，由 RequestLogMiddleware 创建并放入 contextvar，
+  业务代码通过 stage("name") 记录，无需逐层传参；不在请求上下文中时为空操作
+- StageMetrics: 按阶段聚合的耗时直方图，以 Prometheus 文本格式导出（每个进程独立统计）
+
+注意：run_in_executor 不会传递 contextvar，线程池中的耗时需在协程侧的 await 外层记录
+（db.run_db 会复制上下文，数据库线程中的 stage 同样生效）
+"""
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Iterator, Optional, Tuple
+
+_current: ContextVar[Optional["StageTimer"]] = ContextVar("stage_timer", default=None)
+
+_INVALID_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+
+# 直方图桶上限（秒）
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class StageTimer:
+    """单个请求的阶段耗时（毫秒，同名阶段累加）"""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, duration_ms: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + duration_ms
+
+    def merge(self, stages: Dict[str, float]) -> None:
+        """合并其他进程返回的阶段耗时"""
+        for name, duration_ms in stages.items():
+            self.add(name, duration_ms)
+
+    def activate(self) -> Token:
+        """设为当前上下文的计时器"""
+        return _current.set(self)
+
+    @staticmethod
+    def deactivate(token: Token) -> None:
+        _current.reset(token)
+
+    def server_timing(self) -> str:
+        """Server-Timing 响应头"""
+        return ", ".join(
+            f"{_INVALID_NAME.sub('_', name)};dur={duration_ms:.1f}"
+            for name, duration_ms in self.stages.items()
+        )
+
+    def summary(self) -> str:
+        """日志用的 key=value 摘要"""
+        return " ".join(f"{name}={duration_ms:.1f}ms" for name, duration_ms in self.stages.items())
+
+
+def current_timer() -> Optional[StageTimer]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """记录代码块耗时到当前请求的计时器"""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, (time.perf_counter() - start) * 1000)
+
+
+class StageMetrics:
+    """阶段耗时直方图（Prometheus 文本格式导出）"""
+
+    NAME = "aimultibox_stage_duration_seconds"
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        # 阶段 -> [各桶计数..., 总次数], 总耗时（秒）
+        self._counts: Dict[str, list] = {}
+        self._sums: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, duration_ms: float) -> None:
+        seconds = duration_ms / 1000
+        with self._lock:
+            counts = self._counts.get(name)
+            if counts is None:
+                counts = self._counts[name] = [0] * (len(self.buckets) + 1)
+                self._sums[name] = 0.0
+            for i, upper in enumerate(self.buckets):
+                if seconds <= upper:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[name] += seconds
+
+    def observe_timer(self, timer: StageTimer) -> None:
+        for name, duration_ms in timer.stages.items():
+            self.observe(name, duration_ms)
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.NAME} Duration of request processing stages.",
+            f"# TYPE {self.NAME} histogram",
+        ]
+        with self._lock:
+            for name in sorted(self._counts):
+                counts = self._counts[name]
+                label = f'stage="{_INVALID_NAME.sub("_", name)}"'
+                for upper, count in zip(self.buckets, counts):
+                    lines.append(f'{self.NAME}_bucket{{{label},le="{upper}"}} {count}')
+                lines.append(f'{self.NAME}_bucket{{{label},le="+Inf"}} {counts[-1]}')
+                lines.append(f"{self.NAME}_sum{{{label}}} {self._sums[name]:.6f}")
+                lines.append(f"{self.NAME}_count{{{label}}} {counts[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+stage_metrics = StageMetrics()
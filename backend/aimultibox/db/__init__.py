@@ -3,9 +3,14 @@
 
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from contextvars import ContextVar
-from typing import Generator, Optional, Tuple
+from typing import Any, Awaitable, Callable, Generator, Optional, Tuple, TypeVar
 
 from datetime import datetime, timezone
 
@@ -16,6 +21,9 @@ from sqlalchemy.sql import Select, Delete, Update
 from sqlalchemy.types import TypeDecorator
 
 from aimultibox.core.config import settings
+from aimultibox.core.timing import stage
+
+logger = logging.getLogger(__name__)
 
 
 class UTCDateTime(TypeDecorator):
@@ -146,22 +154,60 @@ def _auto_fill_scope(session: Session) -> None:
                 obj.client_id = cid
 
 
+IS_SQLITE = settings.database_url.startswith("sqlite")
+
 engine = create_engine(
     settings.database_url,
     future=True,
     echo=False,
-    connect_args={"check_same_thread": False} if settings.database_url.startswith("sqlite") else {},
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
 )
 
 
 @event.listens_for(engine, "connect")
 def _set_sqlite_pragma(dbapi_connection, connection_record) -> None:
+    """
+    SQLite 连接调优（每个新连接执行一次）
+
+    - WAL：写入不阻塞读取，调度器写汇率时 API 仍可并发查询
+    - synchronous=NORMAL：WAL 下仅检查点时 fsync，断电最多丢失最近的提交，不会损坏数据库
+    - busy_timeout：写锁冲突时等待而非立即报 database is locked
+    """
+    if not IS_SQLITE:
+        return
+    pragmas = [
+        "PRAGMA foreign_keys=ON",
+        f"PRAGMA journal_mode={settings.sqlite_journal_mode.upper()}",
+        f"PRAGMA synchronous={settings.sqlite_synchronous.upper()}",
+        f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}",
+        f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}",
+        f"PRAGMA cache_size={-int(settings.sqlite_cache_size_kb)}",  # 负数表示 KiB
+    ]
+    cursor = dbapi_connection.cursor()
     try:
-        cursor = dbapi_connection.cursor()
-        cursor.execute("PRAGMA foreign_keys=ON")
+        for pragma in pragmas:
+            try:
+                cursor.execute(pragma)
+            except Exception as e:
+                logger.warning(f"SQLite 设置失败 ({pragma}): {e}")
+    finally:
         cursor.close()
-    except Exception:
-        pass
+
+
+def checkpoint_wal(mode: str = "PASSIVE") -> Optional[Tuple[int, int, int]]:
+    """
+    执行 WAL 检查点，将 WAL 内容写回数据库文件
+
+    PASSIVE 不等待读写连接，不影响请求；TRUNCATE 会等待并清空 WAL 文件（用于关闭时）
+
+    Returns:
+        (busy, WAL 总页数, 已写回页数)，非 WAL 模式返回 None
+    """
+    if not IS_SQLITE or settings.sqlite_journal_mode != "wal":
+        return None
+    with engine.connect() as conn:
+        row = conn.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    return tuple(row) if row else None
 
 
 SessionLocal = sessionmaker(bind=engine, class_=Session, autoflush=False, autocommit=False, future=True)
@@ -190,6 +236,46 @@ def session_scope() -> Generator[Session, None, None]:
         session.close()
 
 
+# ==================== 异步访问 ====================
+# 仓储函数均为同步实现；异步路由 / 中间件通过 run_db 在专用线程池中执行，不阻塞事件循环。
+# 执行时复制当前上下文，set_scope 设置的用户范围在线程中同样生效（见 _scope_orm_execute）
+
+T = TypeVar("T")
+
+_db_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(max_workers=max(1, settings.database_threads), thread_name_prefix="db")
+    return _db_executor
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """在数据库线程池中执行同步函数（耗时计入请求的 db 阶段）"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    with stage("db"):
+        return await loop.run_in_executor(_get_db_executor(), functools.partial(ctx.run, func, *args, **kwargs))
+
+
+def to_async(func: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """同步仓储函数的异步版本"""
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+def shutdown_db_executor() -> None:
+    """关闭数据库线程池（等待进行中的查询完成）"""
+    global _db_executor
+    if _db_executor is not None:
+        _db_executor.shutdown(wait=True)
+        _db_executor = None
+
+
 def create_all() -> None:
     """创建所有表（仅用于初始化或迁移脚本）"""
     Base.metadata.create_all(engine)
@@ -202,6 +288,10 @@ __all__ = [
     "engine",
     "SessionLocal",
     "session_scope",
+    "checkpoint_wal",
+    "run_db",
+    "to_async",
+    "shutdown_db_executor",
     "set_scope",
     "reset_scope",
     "disable_scope",
@@ -57,16 +57,34 @@ async def cleanup_rate_history() -> None:
     try:
         from aimultibox.tools.currency_manager.repo import cleanup_old_rates, cleanup_old_alert_events
         from aimultibox.auth.repo import cleanup_expired_sessions, cleanup_old_clients
-        deleted = cleanup_old_rates(days=90)
-        cleanup_old_alert_events(days=7)
-        cleanup_expired_sessions()
-        cleanup_old_clients(days=30)
+        from aimultibox.db import run_db
+        deleted = await run_db(cleanup_old_rates, days=90)
+        await run_db(cleanup_old_alert_events, days=7)
+        await run_db(cleanup_expired_sessions)
+        await run_db(cleanup_old_clients, days=30)
         if deleted > 0:
             logger.info(f"清理了 {deleted} 条过期汇率记录")
     except Exception as e:
         logger.warning(f"清理过期数据失败: {e}")
 
 
+async def checkpoint_database() -> None:
+    """定期执行 WAL 检查点（PASSIVE，不阻塞读写），避免长时间有读连接时 WAL 文件持续增长"""
+    import asyncio
+    from aimultibox.db import checkpoint_wal, run_db
+
+    interval = settings.sqlite_checkpoint_interval
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await run_db(checkpoint_wal)
+            if result:
+                busy, log_pages, checkpointed = result
+                logger.debug(f"WAL 检查点 | busy: {busy} | WAL 页数: {log_pages} | 已写回: {checkpointed}")
+        except Exception as e:
+            logger.warning(f"WAL 检查点失败: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """应用生命周期"""
@@ -80,14 +98,30 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     logger.info(f"{APP_META['name']} 已启动，加载了 {len(ToolLoader._tools)} 个工具")
 
     cleanup_task = asyncio.create_task(cleanup_rate_history())
+    checkpoint_task = (
+        asyncio.create_task(checkpoint_database()) if settings.sqlite_checkpoint_interval > 0 else None
+    )
 
     from aimultibox.tools.currency_manager.fetcher import start_scheduler, stop_scheduler
     await start_scheduler()
 
+    from aimultibox.tools.watermark_removal.api import service as watermark_service, job_manager
+    await watermark_service.startup()
+
     yield
 
+    await job_manager.shutdown()
+    await watermark_service.shutdown()
     await stop_scheduler()
     cleanup_task.cancel()
+    if checkpoint_task is not None:
+        checkpoint_task.cancel()
+    from aimultibox.db import checkpoint_wal, shutdown_db_executor
+    shutdown_db_executor()
+    try:
+        checkpoint_wal("TRUNCATE")
+    except Exception as e:
+        logger.warning(f"WAL 检查点失败: {e}")
     logger.info(f"{APP_META['name']} 已停止")
 
 
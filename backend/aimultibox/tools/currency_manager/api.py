@@ -9,6 +9,7 @@ from fastapi import APIRouter, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse
 
 from aimultibox.core.ratelimit import limiter, DEFAULT_LIMIT
+from aimultibox.db import run_db
 from starlette import status as HTTP
 from aimultibox.schemas import OkResponse
 from . import TOOL_META, RATE_LIMITS, SCHEDULER_CONFIG
@@ -23,6 +24,21 @@ from .schemas import (
 router = APIRouter()
 
 
+def _load_history(currency_pair: str, days: int) -> tuple:
+    """历史与统计（在同一次数据库线程池调用中查询）"""
+    history = service.get_rate_history(currency_pair, days)
+    stats = service.get_rate_stats(currency_pair, days, history=history)
+    return history, stats
+
+
+def _load_summary(currency_pair: str, days: int) -> tuple:
+    """汇总页的数据库查询"""
+    history, stats = _load_history(currency_pair, days)
+    profit = service.get_profit_summary(currency_pair)
+    trades, _ = service.get_trades(currency_pair, limit=100)
+    return history, stats, profit, trades
+
+
 @router.get("/", response_model=ToolInfoResponse)
 async def tool_info() -> dict[str, Any]:
     """获取工具信息"""
@@ -95,8 +111,7 @@ async def get_history(
 
     按货币对和天数返回历史数据，前端可缓存结果
     """
-    history = service.get_rate_history(currency_pair, days)
-    stats = service.get_rate_stats(currency_pair, days, history=history)
+    history, stats = await run_db(_load_history, currency_pair, days)
 
     return {
         "currency_pair": currency_pair,
@@ -125,10 +140,7 @@ async def get_summary(
         "next_refresh_time": None,
         "consecutive_failures": 0,
     }
-    history = service.get_rate_history(currency_pair, days)
-    stats = service.get_rate_stats(currency_pair, days, history=history)
-    profit = service.get_profit_summary(currency_pair)
-    trades, _ = service.get_trades(currency_pair, limit=100)
+    history, stats, profit, trades = await run_db(_load_summary, currency_pair, days)
 
     return {
         "rates": rates,
@@ -148,7 +160,7 @@ async def create_trade(
     data: TradeCreate,
 ) -> dict[str, Any]:
     """创建交易记录"""
-    trade = service.create_trade(data)
+    trade = await run_db(service.create_trade, data)
     return trade
 
 
@@ -160,7 +172,7 @@ async def get_trades(
     offset: int = Query(0, ge=0),
 ) -> dict[str, Any]:
     """获取交易列表"""
-    trades, total = service.get_trades(currency_pair, type, limit, offset)
+    trades, total = await run_db(service.get_trades, currency_pair, type, limit, offset)
     return {
         "items": trades,
         "total": total,
@@ -172,7 +184,7 @@ async def get_trade(
     trade_id: int,
 ) -> dict[str, Any]:
     """获取单条交易记录"""
-    trade = service.get_trade(trade_id)
+    trade = await run_db(service.get_trade, trade_id)
     if not trade:
         raise HTTPException(status_code=HTTP.HTTP_404_NOT_FOUND, detail="交易记录不存在")
 
@@ -189,7 +201,7 @@ async def update_trade(
 ) -> dict[str, bool]:
 
     """更新交易记录"""
-    success = service.update_trade(trade_id, data)
+    success = await run_db(service.update_trade, trade_id, data)
     if not success:
         raise HTTPException(status_code=HTTP.HTTP_404_NOT_FOUND, detail="交易记录不存在或无更新")
 
@@ -204,7 +216,7 @@ async def delete_trade(
     trade_id: int,
 ) -> dict[str, bool]:
     """删除交易记录"""
-    success = service.delete_trade(trade_id)
+    success = await run_db(service.delete_trade, trade_id)
     if not success:
         raise HTTPException(status_code=HTTP.HTTP_404_NOT_FOUND, detail="交易记录不存在")
 
@@ -219,7 +231,7 @@ async def create_alert(
     data: AlertCreate,
 ) -> dict[str, Any]:
     """创建预警规则"""
-    alert = service.create_alert_rule(data)
+    alert = await run_db(service.create_alert_rule, data)
     return alert
 
 
@@ -228,7 +240,7 @@ async def get_alerts(
     currency_pair: Optional[str] = Query(None, description="货币对筛选"),
 ) -> dict[str, Any]:
     """获取预警规则列表"""
-    alerts = service.get_alert_rules(currency_pair)
+    alerts = await run_db(service.get_alert_rules, currency_pair)
     return {
         "items": alerts,
         "total": len(alerts),
@@ -240,7 +252,7 @@ async def get_alert(
     alert_id: int,
 ) -> dict[str, Any]:
     """获取单条预警规则"""
-    alert = service.get_alert_rule(alert_id)
+    alert = await run_db(service.get_alert_rule, alert_id)
     if not alert:
         raise HTTPException(status_code=HTTP.HTTP_404_NOT_FOUND, detail="预警规则不存在")
 
@@ -256,7 +268,7 @@ async def update_alert(
     data: AlertUpdate,
 ) -> dict[str, bool]:
     """更新预警规则"""
-    success = service.update_alert_rule(alert_id, data)
+    success = await run_db(service.update_alert_rule, alert_id, data)
     if not success:
         raise HTTPException(status_code=HTTP.HTTP_404_NOT_FOUND, detail="预警规则不存在或无更新")
 
@@ -271,7 +283,7 @@ async def delete_alert(
     alert_id: int,
 ) -> dict[str, bool]:
     """删除预警规则"""
-    success = service.delete_alert_rule(alert_id)
+    success = await run_db(service.delete_alert_rule, alert_id)
     if not success:
         raise HTTPException(status_code=HTTP.HTTP_404_NOT_FOUND, detail="预警规则不存在")
 
@@ -284,7 +296,7 @@ async def export_trades_csv(
     type: Optional[str] = Query(None, description="类型筛选: buy/sell"),
 ) -> StreamingResponse:
     """导出交易记录为 CSV"""
-    trades, _ = service.get_trades(currency_pair, type, limit=1000)
+    trades, _ = await run_db(service.get_trades, currency_pair, type, limit=1000)
 
     if not trades:
         raise HTTPException(status_code=HTTP.HTTP_404_NOT_FOUND, detail="暂无数据可导出")
@@ -7,11 +7,11 @@ import logging
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Tuple
 
-from sqlalchemy import select, func, delete
+from sqlalchemy import select, func, delete, or_
 from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 
-from aimultibox.db import session_scope, disable_scope
+from aimultibox.db import session_scope, disable_scope, to_async
 from aimultibox.core import clear_cache, get_cache
 from .models import RateHistory, Transaction, Alert, AlertEvent
 
@@ -30,44 +30,82 @@ def _cache_key(prefix: str, currency_pair: str, days: int) -> str:
     return f"{prefix}:{currency_pair}:{days}"
 
 
+# 单条 INSERT 的最大行数（每行 10 个绑定参数，远低于 SQLite 绑定参数上限）
+SAVE_RATES_CHUNK = 500
+
+_RATE_UPDATE_COLUMNS = ("rate", "rtb_bid", "rth_bid", "rtc_ofr", "rth_ofr", "rate_date", "time_str", "source")
+
+
+def _rate_row(rate: dict) -> dict:
+    """汇率数据转为 rate_history 行"""
+    timestamp = rate["timestamp"]
+    ts = timestamp.astimezone(timezone.utc) if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+    return {
+        "currency_pair": rate["currency_pair"],
+        "rate": rate["rate"],
+        "rtb_bid": rate.get("rtb_bid"),
+        "rth_bid": rate.get("rth_bid"),
+        "rtc_ofr": rate.get("rtc_ofr"),
+        "rth_ofr": rate.get("rth_ofr"),
+        "timestamp": timestamp,
+        "rate_date": ts.strftime("%Y-%m-%d"),
+        "time_str": rate.get("time_str") or "",
+        "source": rate.get("source") or "CMB",
+    }
+
+
+def save_rates(rates: List[dict], skip_cache_clear: bool = False) -> List[dict]:
+    """
+    批量保存汇率数据（单个事务，多行 INSERT ... ON CONFLICT DO UPDATE）
+
+    同一 (currency_pair, timestamp) 已存在且各字段均未变化时不做更新
+
+    Returns:
+        新增或有变化的行：[{"id", "currency_pair", "timestamp"}]
+    """
+    # 同一批次内重复的键只保留最后一条（同一条语句不能两次更新同一行）
+    rows = list({(r["currency_pair"], r["timestamp"]): r for r in map(_rate_row, rates)}.values())
+    if not rows:
+        return []
+
+    changed: List[dict] = []
+    with session_scope() as session:
+        for offset in range(0, len(rows), SAVE_RATES_CHUNK):
+            stmt = sqlite_insert(RateHistory).values(rows[offset:offset + SAVE_RATES_CHUNK])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["currency_pair", "timestamp"],
+                set_={name: stmt.excluded[name] for name in _RATE_UPDATE_COLUMNS},
+                where=or_(*[
+                    RateHistory.__table__.c[name].is_distinct_from(stmt.excluded[name])
+                    for name in _RATE_UPDATE_COLUMNS
+                ]),
+            ).returning(RateHistory.id, RateHistory.currency_pair, RateHistory.timestamp)
+            changed.extend(dict(row._mapping) for row in session.execute(stmt))
+
+    if changed and not skip_cache_clear:
+        clear_cache(CACHE_NAME)
+    return changed
+
+
 def save_rate(currency_pair: str, rate: float,
               rtb_bid: float, rth_bid: float, rtc_ofr: float, rth_ofr: float,
               timestamp: datetime, time_str: str = "", source: str = "CMB",
               skip_cache_clear: bool = False) -> bool:
     """保存汇率数据"""
-    ts = timestamp.astimezone(timezone.utc) if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
-    rate_date = ts.strftime("%Y-%m-%d")
-
     if not skip_cache_clear:
         clear_cache(CACHE_NAME)
 
-    with session_scope() as session:
-        stmt = sqlite_insert(RateHistory).values(
-            currency_pair=currency_pair,
-            rate=rate,
-            rtb_bid=rtb_bid,
-            rth_bid=rth_bid,
-            rtc_ofr=rtc_ofr,
-            rth_ofr=rth_ofr,
-            timestamp=timestamp,
-            rate_date=rate_date,
-            time_str=time_str,
-            source=source,
-        )
-        stmt = stmt.on_conflict_do_update(
-            index_elements=["currency_pair", "timestamp"],
-            set_={
-                "rate": stmt.excluded.rate,
-                "rtb_bid": stmt.excluded.rtb_bid,
-                "rth_bid": stmt.excluded.rth_bid,
-                "rtc_ofr": stmt.excluded.rtc_ofr,
-                "rth_ofr": stmt.excluded.rth_ofr,
-                "rate_date": stmt.excluded.rate_date,
-                "time_str": stmt.excluded.time_str,
-                "source": stmt.excluded.source,
-            },
-        )
-        session.execute(stmt)
+    save_rates([{
+        "currency_pair": currency_pair,
+        "rate": rate,
+        "rtb_bid": rtb_bid,
+        "rth_bid": rth_bid,
+        "rtc_ofr": rtc_ofr,
+        "rth_ofr": rth_ofr,
+        "timestamp": timestamp,
+        "time_str": time_str,
+        "source": source,
+    }], skip_cache_clear=True)
     return True
 
 
@@ -533,3 +571,13 @@ def merge_client_to_user(client_id: str, user_id: str) -> None:
                 .where(AlertEvent.user_id.is_(None), AlertEvent.client_id == client_id)
                 .values(user_id=user_id)
             )
+
+
+# ==================== 异步版本（数据库线程池执行） ====================
+
+save_rates_async = to_async(save_rates)
+get_alerts_async = to_async(get_alerts)
+get_rate_24h_ago_async = to_async(get_rate_24h_ago)
+update_alert_triggered_async = to_async(update_alert_triggered)
+create_alert_event_async = to_async(create_alert_event)
+merge_client_to_user_async = to_async(merge_client_to_user)
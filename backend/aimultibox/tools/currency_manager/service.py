@@ -7,13 +7,13 @@ from datetime import date as date_cls
 from typing import List, Optional, Tuple
 
 from .fetcher import fetcher
-from aimultibox.core import clear_cache
 from .repo import (
-    save_rate, get_rate_history, get_latest_rate, get_rate_stats, get_rate_24h_ago,
-    get_daily_closing_rates, CACHE_NAME,
+    save_rates_async, get_rate_history, get_latest_rate, get_rate_stats, get_rate_24h_ago_async,
+    get_daily_closing_rates,
     create_transaction, get_transaction, update_transaction, delete_transaction,
-    create_alert, get_alerts, get_alert, update_alert, delete_alert, update_alert_triggered,
-    create_alert_event, get_alert_events, get_alert_event_latest_id,
+    create_alert, get_alerts, get_alert, update_alert, delete_alert,
+    get_alerts_async, update_alert_triggered_async, create_alert_event_async,
+    get_alert_events, get_alert_event_latest_id,
 )
 from .calculator import calculate_profit, get_trades_with_profit
 from .schemas import (
@@ -41,20 +41,8 @@ class CurrencyMonitorService:
         )
 
         if fetched:
-            for rate in rates:
-                save_rate(
-                    currency_pair=rate["currency_pair"],
-                    rate=rate["rate"],
-                    rtb_bid=rate["rtb_bid"],
-                    rth_bid=rate["rth_bid"],
-                    rtc_ofr=rate["rtc_ofr"],
-                    rth_ofr=rate["rth_ofr"],
-                    timestamp=rate["timestamp"],
-                    time_str=rate.get("time_str", ""),
-                    source=rate.get("source", "CMB"),
-                    skip_cache_clear=True,
-                )
-            clear_cache(CACHE_NAME)
+            changed = await save_rates_async(rates)
+            logger.debug(f"汇率入库: {len(rates)} 条，新增或变化 {len(changed)} 条")
 
         return ([
                     RateData(
@@ -335,7 +323,7 @@ class CurrencyMonitorService:
 
         triggered: List[dict] = []
         for rate in rates:
-            alerts = get_alerts(rate.currency_pair, enabled_only=True, include_all=True)
+            alerts = await get_alerts_async(rate.currency_pair, enabled_only=True, include_all=True)
             for alert in alerts:
                 condition = alert["condition"]
                 threshold = alert["threshold"]
@@ -346,7 +334,7 @@ class CurrencyMonitorService:
                 elif condition == "rate_below" and rate.rate < threshold:
                     should_trigger = True
                 elif condition == "daily_change_above":
-                    rate_24h_ago_data = get_rate_24h_ago(rate.currency_pair)
+                    rate_24h_ago_data = await get_rate_24h_ago_async(rate.currency_pair)
                     if rate_24h_ago_data:
                         old_rate = rate_24h_ago_data["rate"]
                         daily_change = abs((rate.rate - old_rate) / old_rate * 100)
@@ -357,8 +345,8 @@ class CurrencyMonitorService:
                 owner_user_id = alert.get("user_id")
                 if should_trigger and (owner_client_id or owner_user_id):
                     triggered_at = datetime.now(timezone.utc)
-                    update_alert_triggered(alert["id"], triggered_at, include_all=True)
-                    event_id = create_alert_event(
+                    await update_alert_triggered_async(alert["id"], triggered_at, include_all=True)
+                    event_id = await create_alert_event_async(
                         alert_id=alert["id"],
                         currency_pair=rate.currency_pair,
                         condition=condition,
@@ -14,4 +14,5 @@ RATE_LIMITS = {
     "remove": "1/10seconds",       # 手动去水印（10秒1次）
     "remove-auto": "1/12seconds",  # 自动去水印（12秒1次，消耗更大）
     "detect": "1/3seconds",        # 检测接口
+    "jobs": "1/3seconds",          # 提交异步任务（并发由任务队列控制）
 }
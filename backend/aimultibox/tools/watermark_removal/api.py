@@ -2,17 +2,156 @@
 """水印去除 - API 路由"""
 
 import base64
-from typing import Any
-from fastapi import APIRouter, File, UploadFile, HTTPException, Request, Response
+from typing import Any, Dict, Optional, Tuple, Union
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query, Request, Response
 
+from aimultibox.auth.utils import get_client_id, get_user_id
+from aimultibox.core.config import settings
 from aimultibox.core.ratelimit import limiter, DEFAULT_LIMIT
 from starlette import status as HTTP
 from . import TOOL_META, RATE_LIMITS
+from .encoder import EncodeOptions, EncodedImage
+from .jobs import Job, JobManager, JobQueueFullError, JobStatus, PRIORITY_ANONYMOUS, PRIORITY_USER
 from .service import WatermarkRemovalService
-from .schemas import RemovalResult, DetectionResult, ToolInfoResponse, ModelStatusResponse
+from .upload import UploadRejectedError, read_upload, probe_image
+from .worker import WorkerQueueFullError
+from .schemas import RemovalResult, DetectionResult, ToolInfoResponse, ModelStatusResponse, JobStatusResponse
 
 router = APIRouter()
 service = WatermarkRemovalService()
+job_manager = JobManager(
+    service,
+    workers=settings.watermark_job_workers,
+    max_queued=settings.watermark_job_queue_size,
+    ttl=settings.watermark_job_ttl,
+    max_jobs=settings.watermark_job_max_stored,
+    max_result_bytes=settings.watermark_job_max_result_bytes,
+)
+
+# 服务繁忙时建议客户端重试间隔（秒）
+RETRY_AFTER_SECONDS = 5
+
+# 二进制响应：Accept 媒体类型 -> 输出格式
+BINARY_MEDIA_TYPES = {
+    "image/webp": "webp",
+    "image/png": "png",
+    "image/jpeg": "jpeg",
+}
+
+
+def _service_busy(message: str) -> HTTPException:
+    """服务繁忙（503），附带 Retry-After"""
+    return HTTPException(
+        status_code=HTTP.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=message,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
+
+def _parse_accept(header: str) -> Dict[str, float]:
+    """解析 Accept 头：媒体范围 -> q 值（同一范围重复出现时取首个）"""
+    ranges: Dict[str, float] = {}
+    for item in header.split(","):
+        media_range, *params = [part.strip() for part in item.split(";")]
+        if not media_range or "/" not in media_range:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = min(1.0, max(0.0, float(value)))
+                except ValueError:
+                    q = 0.0
+        ranges.setdefault(media_range.lower(), q)
+    return ranges
+
+
+def _accept_quality(ranges: Dict[str, float], media_type: str) -> Tuple[float, bool]:
+    """
+    媒体类型的 q 值（按最具体的匹配：type/subtype > type/* > */*），未携带 Accept 视为 */*
+
+    Returns:
+        (q, 是否由具体类型或 type/* 显式匹配)
+    """
+    if not ranges:
+        return 1.0, False
+    if media_type in ranges:
+        return ranges[media_type], True
+    wildcard = f"{media_type.split('/')[0]}/*"
+    if wildcard in ranges:
+        return ranges[wildcard], True
+    return ranges.get("*/*", 0.0), False
+
+
+def _negotiate_output(request: Request, response_format: str,
+                      output_format: Optional[str], quality: Optional[int]) -> Tuple[bool, EncodeOptions]:
+    """
+    协商响应方式与输出编码
+
+    - response_format=binary，或 Accept 中某个图片类型（image/webp、image/png、image/jpeg）的 q 值
+      高于 application/json 时返回图片流，否则保持 JSON base64 响应（同分时优先 JSON）
+    - 输出格式优先级：output_format 参数 > 图片流时 Accept 显式接受的 q 值最高的图片类型 > 配置默认值；
+      JSON 响应不受 Accept 影响
+    """
+    ranges = _parse_accept(request.headers.get("accept", ""))
+    json_q, _ = _accept_quality(ranges, "application/json")
+
+    accepted, accepted_q, explicit = None, 0.0, False
+    for media_type, fmt in BINARY_MEDIA_TYPES.items():
+        q, matched = _accept_quality(ranges, media_type)
+        if q > accepted_q:
+            accepted, accepted_q, explicit = fmt, q, matched
+
+    binary = response_format == "binary" or (accepted is not None and accepted_q > json_q)
+    negotiated = accepted if binary and explicit else None
+    encode = EncodeOptions(
+        format=output_format or negotiated or settings.watermark_output_format,
+        quality=quality,
+    )
+    return binary, encode
+
+
+def _encode_headers(result: EncodedImage) -> dict[str, str]:
+    """编码耗时与输出大小，便于调优"""
+    return {
+        "X-Encode-Time-Ms": f"{result.encode_ms:.1f}",
+        "X-Output-Size": str(result.size),
+    }
+
+
+def _image_response(result: EncodedImage) -> Response:
+    """直接返回已编码的图片字节（带 Content-Length）"""
+    return Response(content=result.data, media_type=result.media_type, headers=_encode_headers(result))
+
+
+def _removal_response(result: EncodedImage, binary: bool,
+                      response: Response) -> Union[dict[str, Any], Response]:
+    if binary:
+        return _image_response(result)
+    response.headers.update(_encode_headers(result))
+    return {
+        "image_base64": base64.b64encode(result.data).decode("utf-8"),
+        "format": result.format,
+    }
+
+
+async def _read_image(file: UploadFile, name: str = "图片") -> bytes:
+    """分块读取上传图片，超出大小 / 像素上限时尽早拒绝"""
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=HTTP.HTTP_400_BAD_REQUEST, detail=f"无效的{name}文件")
+    try:
+        data = await read_upload(file)
+        probe_image(data)
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    return data
+
+
+def _ensure_ready() -> None:
+    """模型预热期间返回 503，由客户端稍后重试"""
+    if service.is_warming:
+        raise _service_busy("模型加载中，请稍后重试")
 
 
 @router.get("/", response_model=ToolInfoResponse)
@@ -44,32 +183,33 @@ async def remove_watermark(
     response: Response,
     image: UploadFile = File(...),
     mask: UploadFile = File(...),
-) -> dict[str, Any]:
+    response_format: str = Query("json", pattern="^(json|binary)$", description="响应格式：json（base64）/ binary（图片字节）"),
+    output_format: Optional[str] = Query(None, pattern="^(png|webp|jpeg|auto)$", description="输出格式，auto 与输入一致"),
+    quality: Optional[int] = Query(None, ge=1, le=100, description="jpeg / 有损 webp 质量"),
+) -> Union[dict[str, Any], Response]:
     """去除水印（需要遮罩）"""
     try:
-        if not image.content_type or not image.content_type.startswith("image/"):
-            raise HTTPException(status_code=HTTP.HTTP_400_BAD_REQUEST, detail="无效的图片文件")
-
-        if not mask.content_type or not mask.content_type.startswith("image/"):
-            raise HTTPException(status_code=HTTP.HTTP_400_BAD_REQUEST, detail="无效的遮罩文件")
+        _ensure_ready()
 
-        image_bytes = await image.read()
-        mask_bytes = await mask.read()
+        image_bytes = await _read_image(image)
+        mask_bytes = await _read_image(mask, "遮罩")
 
+        binary, encode = _negotiate_output(request, response_format, output_format, quality)
         result = await service.remove_watermark(
             image_bytes=image_bytes,
             mask_bytes=mask_bytes,
+            encode=encode,
         )
 
         if result is None:
             raise HTTPException(status_code=HTTP.HTTP_500_INTERNAL_SERVER_ERROR, detail="处理失败")
 
-        result_base64 = base64.b64encode(result).decode("utf-8")
-
-        return {"image_base64": result_base64}
+        return _removal_response(result, binary, response)
 
     except HTTPException:
         raise
+    except WorkerQueueFullError as e:
+        raise _service_busy(str(e))
     except Exception as e:
         raise HTTPException(status_code=HTTP.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -80,28 +220,32 @@ async def remove_watermark_auto(
     request: Request,
     response: Response,
     image: UploadFile = File(...),
-) -> dict[str, Any]:
+    response_format: str = Query("json", pattern="^(json|binary)$", description="响应格式：json（base64）/ binary（图片字节）"),
+    output_format: Optional[str] = Query(None, pattern="^(png|webp|jpeg|auto)$", description="输出格式，auto 与输入一致"),
+    quality: Optional[int] = Query(None, ge=1, le=100, description="jpeg / 有损 webp 质量"),
+) -> Union[dict[str, Any], Response]:
     """自动检测并去除水印"""
     try:
-        if not image.content_type or not image.content_type.startswith("image/"):
-            raise HTTPException(status_code=HTTP.HTTP_400_BAD_REQUEST, detail="无效的图片文件")
+        _ensure_ready()
 
-        image_bytes = await image.read()
+        image_bytes = await _read_image(image)
 
+        binary, encode = _negotiate_output(request, response_format, output_format, quality)
         result = await service.remove_watermark(
             image_bytes=image_bytes,
             mask_bytes=None,
+            encode=encode,
         )
 
         if result is None:
             raise HTTPException(status_code=HTTP.HTTP_500_INTERNAL_SERVER_ERROR, detail="处理失败")
 
-        result_base64 = base64.b64encode(result).decode("utf-8")
-
-        return {"image_base64": result_base64}
+        return _removal_response(result, binary, response)
 
     except HTTPException:
         raise
+    except WorkerQueueFullError as e:
+        raise _service_busy(str(e))
     except Exception as e:
         raise HTTPException(status_code=HTTP.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -115,10 +259,9 @@ async def detect_watermark(
 ) -> dict[str, Any]:
     """检测水印区域"""
     try:
-        if not image.content_type or not image.content_type.startswith("image/"):
-            raise HTTPException(status_code=HTTP.HTTP_400_BAD_REQUEST, detail="无效的图片文件")
+        _ensure_ready()
 
-        image_bytes = await image.read()
+        image_bytes = await _read_image(image)
         regions = await service.detect_watermark(image_bytes)
 
         return {
@@ -128,10 +271,78 @@ async def detect_watermark(
 
     except HTTPException:
         raise
+    except WorkerQueueFullError as e:
+        raise _service_busy(str(e))
     except Exception as e:
         raise HTTPException(status_code=HTTP.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+def _get_job(request: Request, job_id: str) -> Job:
+    """获取任务（仅提交的客户端可见）"""
+    job = job_manager.get(job_id)
+    if job is None or (job.client_id and job.client_id != get_client_id(request)):
+        raise HTTPException(status_code=HTTP.HTTP_404_NOT_FOUND, detail="任务不存在或已过期")
+    return job
+
+
+@router.post("/jobs", response_model=JobStatusResponse, status_code=HTTP.HTTP_202_ACCEPTED)
+@limiter.limit(RATE_LIMITS.get("jobs", DEFAULT_LIMIT))
+async def submit_job(
+    request: Request,
+    response: Response,
+    image: UploadFile = File(...),
+    mask: Optional[UploadFile] = File(None),
+    output_format: Optional[str] = Query(None, pattern="^(png|webp|jpeg|auto)$", description="输出格式，auto 与输入一致"),
+    quality: Optional[int] = Query(None, ge=1, le=100, description="jpeg / 有损 webp 质量"),
+) -> dict[str, Any]:
+    """提交异步去水印任务（不传遮罩时自动检测），进度通过 SSE watermark_job 事件推送"""
+    try:
+        _ensure_ready()
+
+        image_bytes = await _read_image(image)
+        mask_bytes = await _read_image(mask, "遮罩") if mask is not None else None
+
+        job = await job_manager.submit(
+            image_bytes,
+            mask_bytes,
+            EncodeOptions(format=output_format or settings.watermark_output_format, quality=quality),
+            client_id=get_client_id(request),
+            priority=PRIORITY_USER if get_user_id(request) else PRIORITY_ANONYMOUS,
+        )
+        return job.to_dict()
+
+    except HTTPException:
+        raise
+    except JobQueueFullError as e:
+        raise _service_busy(str(e))
+    except Exception as e:
+        raise HTTPException(status_code=HTTP.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(request: Request, job_id: str) -> dict[str, Any]:
+    """查询任务状态"""
+    return _get_job(request, job_id).to_dict()
+
+
+@router.get("/jobs/{job_id}/result", response_model=RemovalResult)
+async def get_job_result(
+    request: Request,
+    response: Response,
+    job_id: str,
+    response_format: str = Query("json", pattern="^(json|binary)$", description="响应格式：json（base64）/ binary（图片字节）"),
+) -> Union[dict[str, Any], Response]:
+    """获取任务结果"""
+    job = _get_job(request, job_id)
+    if job.status == JobStatus.FAILED.value:
+        raise HTTPException(status_code=HTTP.HTTP_500_INTERNAL_SERVER_ERROR, detail=job.error or "处理失败")
+    if job.status != JobStatus.DONE.value or job.result is None:
+        raise HTTPException(status_code=HTTP.HTTP_409_CONFLICT, detail="任务未完成")
+
+    binary, _ = _negotiate_output(request, response_format, None, None)
+    return _removal_response(job.result, binary, response)
+
+
 @router.get("/status", response_model=ModelStatusResponse)
 async def get_status() -> dict[str, Any]:
     """获取模型状态"""
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+水印去除 - 结果缓存
+
+按内容哈希（图片 + 遮罩 + 模式）缓存处理结果：
+- 内存层：LRU，按字节数限制
+- 磁盘层（可选）：data/ 下的文件，按总字节数 LRU 淘汰
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any, Union
+
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(*parts: Union[bytes, str, None]) -> str:
+    """由多段内容生成缓存 key（各段带长度前缀，避免拼接歧义）"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            part = b""
+        elif isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """去水印结果缓存"""
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[Path] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self._memory: LRUCache = LRUCache(maxsize=max(1, max_bytes), getsizeof=len)
+        self._memory_lock = threading.Lock()
+
+        self.disk_dir = disk_dir if disk_dir and disk_max_bytes > 0 else None
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+        if self.disk_dir:
+            self._load_disk_index()
+
+    # ==================== 对外接口 ====================
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """读取缓存（内存未命中时查磁盘并回填内存）"""
+        data = self._memory_get(key)
+        if data is not None:
+            self.memory_hits += 1
+            return data
+
+        if self.disk_dir:
+            data = await asyncio.to_thread(self._disk_get, key)
+            if data is not None:
+                self.disk_hits += 1
+                self._memory_set(key, data)
+                return data
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, data: bytes) -> None:
+        """写入缓存"""
+        self.stores += 1
+        self._memory_set(key, data)
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_set, key, data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_bytes": int(self._memory.currsize),
+            "memory_max_bytes": self.max_bytes,
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0,
+        }
+
+    # ==================== 内存层 ====================
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        with self._memory_lock:
+            return self._memory.get(key)
+
+    def _memory_set(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._memory_lock:
+            self._memory[key] = data
+
+    # ==================== 磁盘层 ====================
+
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.bin"
+
+    def _load_disk_index(self) -> None:
+        """按最近访问时间重建磁盘索引"""
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.disk_dir.glob("*.bin"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        with self._disk_lock:
+            if key not in self._disk_index:
+                return None
+            path = self._path(key)
+            try:
+                data = path.read_bytes()
+                os.utime(path)  # 更新 mtime 作为最近访问时间
+            except OSError:
+                self._disk_bytes -= self._disk_index.pop(key)
+                return None
+            self._disk_index.move_to_end(key)
+            return data
+
+    def _disk_set(self, key: str, data: bytes) -> None:
+        if len(data) > self.disk_max_bytes:
+            return
+        with self._disk_lock:
+            if key in self._disk_index:
+                self._disk_index.move_to_end(key)
+                return
+
+            path = self._path(key)
+            tmp_path = path.with_suffix(".tmp")
+            try:
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"写入结果缓存失败: {e}")
+                return
+
+            self._disk_index[key] = len(data)
+            self._disk_bytes += len(data)
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """淘汰最久未访问的文件直到低于上限"""
+        while self._disk_bytes > self.disk_max_bytes and self._disk_index:
+            key, size = self._disk_index.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
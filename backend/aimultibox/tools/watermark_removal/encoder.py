@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+水印去除 - 输出编码
+
+按请求选择输出格式与压缩参数：
+- png  : 无损，zlib 压缩等级可调（低等级更快）
+- webp : 默认无损；指定 quality 时为有损
+- jpeg : 有损，quality 可调
+- auto : 与输入格式一致（无法识别时回退默认格式）
+"""
+
+import io
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
+
+from PIL import Image
+
+from aimultibox.core.config import settings
+
+
+class OutputFormat(str, Enum):
+    """输出格式"""
+    PNG = "png"
+    WEBP = "webp"
+    JPEG = "jpeg"
+    AUTO = "auto"  # 与输入格式一致
+
+
+# PIL 格式名 -> 输出格式
+_SOURCE_FORMATS = {
+    "PNG": OutputFormat.PNG.value,
+    "WEBP": OutputFormat.WEBP.value,
+    "JPEG": OutputFormat.JPEG.value,
+    "MPO": OutputFormat.JPEG.value,  # 部分手机拍摄的 JPEG
+}
+
+
+@dataclass
+class EncodeOptions:
+    """编码参数"""
+    format: str = OutputFormat.PNG.value
+    quality: Optional[int] = None  # jpeg / 有损 webp 质量（1-100），为空使用配置默认值
+
+
+@dataclass
+class EncodedImage:
+    """编码结果"""
+    data: bytes
+    format: str
+    encode_ms: float
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    @property
+    def media_type(self) -> str:
+        return f"image/{self.format}"
+
+
+def resolve_format(requested: str, source_format: Optional[str] = None) -> str:
+    """解析最终输出格式（auto 取输入格式）"""
+    if requested == OutputFormat.AUTO.value:
+        fallback = settings.watermark_output_format
+        if fallback == OutputFormat.AUTO.value:
+            fallback = OutputFormat.PNG.value
+        return _SOURCE_FORMATS.get((source_format or "").upper(), fallback)
+    return requested
+
+
+def encode_image(image: Image.Image, options: EncodeOptions) -> EncodedImage:
+    """编码图片（CPU 密集，应在线程池中调用）"""
+    start = time.perf_counter()
+    output = io.BytesIO()
+
+    if options.format == OutputFormat.JPEG.value:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(
+            output, format="JPEG",
+            quality=options.quality or settings.watermark_jpeg_quality,
+            optimize=False,
+        )
+    elif options.format == OutputFormat.WEBP.value:
+        if options.quality is None and settings.watermark_webp_lossless:
+            # method 越小越快，无损模式下 quality 表示压缩力度
+            image.save(output, format="WEBP", lossless=True, quality=0, method=1)
+        else:
+            image.save(
+                output, format="WEBP",
+                quality=options.quality or settings.watermark_webp_quality,
+                method=4,
+            )
+    else:
+        image.save(output, format="PNG", compress_level=settings.watermark_png_compress_level)
+
+    return EncodedImage(
+        data=output.getvalue(),
+        format=options.format,
+        encode_ms=(time.perf_counter() - start) * 1000,
+    )
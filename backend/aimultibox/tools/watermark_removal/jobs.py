@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+水印去除 - 异步任务
+
+大图（分块推理）耗时较长时，提交后立即返回任务 ID，由固定数量的任务协程按优先级处理：
+- 登录用户优先，同优先级先进先出；排队数超出上限时拒绝
+- 处理进度（已完成窗口数 / 总数）与状态变化通过 SSE 推送给提交的客户端（事件 watermark_job）；
+  process 后端的进度由 worker 经进程间队列回传（见 worker.py）
+- 任务保存在内存中：排队 / 处理中的任务不会被淘汰；已完成的任务按完成时间过期，
+  结果总字节数或已完成任务数超出上限时淘汰最早完成的任务
+"""
+
+import asyncio
+import itertools
+import logging
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Optional, Dict, Any, List, Set
+
+from aimultibox.core.sse import sse_manager
+from aimultibox.core.timing import StageTimer, stage_metrics
+from .encoder import EncodeOptions, EncodedImage
+from .model import inpaint_progress
+from .service import WatermarkRemovalService
+
+logger = logging.getLogger(__name__)
+
+JOB_EVENT = "watermark_job"
+
+# 优先级（数值越小越先处理）
+PRIORITY_USER = 0
+PRIORITY_ANONYMOUS = 1
+
+
+class JobStatus(str, Enum):
+    """任务状态"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class JobQueueFullError(RuntimeError):
+    """任务排队已满"""
+
+
+@dataclass
+class Job:
+    """去水印任务"""
+    id: str
+    client_id: Optional[str]
+    priority: int
+    encode: EncodeOptions
+    image_bytes: Optional[bytes] = None  # 处理完成后释放
+    mask_bytes: Optional[bytes] = None
+    status: str = JobStatus.QUEUED.value
+    done: int = 0  # 已完成的推理窗口数
+    total: int = 0  # 推理窗口总数（开始推理后确定）
+    error: Optional[str] = None
+    result: Optional[EncodedImage] = None
+    stages: Dict[str, float] = field(default_factory=dict)
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "error": self.error,
+            "format": self.result.format if self.result else None,
+            "stages": {name: round(ms, 1) for name, ms in self.stages.items()},
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    异步任务管理
+
+    任务协程数即去水印的最大并发数；推理本身仍经过 service（inline / process 后端、结果缓存）
+    """
+
+    def __init__(self, service: WatermarkRemovalService, workers: int = 1,
+                 max_queued: int = 32, ttl: int = 600, max_jobs: int = 128,
+                 max_result_bytes: int = 256 * 1024 * 1024):
+        self.service = service
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.ttl = ttl
+        self.max_jobs = max(1, max_jobs)  # 最多保留的已完成任务数
+        self.max_result_bytes = max_result_bytes  # 已完成任务的结果总字节数上限
+        self._jobs: Dict[str, Job] = {}
+        self._finished: "OrderedDict[str, int]" = OrderedDict()  # 已完成任务 ID -> 结果字节数（按完成顺序）
+        self._result_bytes = 0
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._notify_tasks: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._seq = itertools.count()
+        self._queued = 0
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def result_bytes(self) -> int:
+        return self._result_bytes
+
+    def _finish(self, job: Job) -> None:
+        """记录已完成任务并按上限淘汰最早完成的任务（刚完成的任务至少保留到过期）"""
+        size = job.result.size if job.result else 0
+        self._finished[job.id] = size
+        self._result_bytes += size
+        while len(self._finished) > 1 and (
+            self._result_bytes > self.max_result_bytes or len(self._finished) > self.max_jobs
+        ):
+            self._drop(next(iter(self._finished)))
+
+    def _drop(self, job_id: str) -> None:
+        self._jobs.pop(job_id, None)
+        self._result_bytes -= self._finished.pop(job_id, 0)
+
+    def _expire(self) -> None:
+        """清理过期的已完成任务（排队 / 处理中的任务不过期）"""
+        now = datetime.now(timezone.utc)
+        while self._finished:
+            job = self._jobs.get(next(iter(self._finished)))
+            if job is not None and (now - job.finished_at).total_seconds() < self.ttl:
+                break
+            self._drop(next(iter(self._finished)))
+
+    def _ensure_workers(self) -> None:
+        """按事件循环启动任务协程"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks and not all(task.done() for task in self._tasks):
+            return
+        self._loop = loop
+        self._queue = asyncio.PriorityQueue()
+        self._queued = 0
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, image_bytes: bytes, mask_bytes: Optional[bytes], encode: EncodeOptions,
+                     client_id: Optional[str] = None, priority: int = PRIORITY_ANONYMOUS) -> Job:
+        """
+        提交任务
+
+        Raises:
+            JobQueueFullError: 排队数已达上限
+        """
+        self._ensure_workers()
+        if self._queued >= self.max_queued:
+            raise JobQueueFullError("去水印任务队列已满")
+
+        job = Job(
+            id=uuid.uuid4().hex,
+            client_id=client_id,
+            priority=priority,
+            encode=encode,
+            image_bytes=image_bytes,
+            mask_bytes=mask_bytes,
+        )
+        self._expire()
+        self._jobs[job.id] = job
+        self._queued += 1
+        self._queue.put_nowait((priority, next(self._seq), job.id))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    async def shutdown(self) -> None:
+        """停止任务协程（未完成的任务丢弃）"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            self._queued -= 1
+            job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Job) -> None:
+        job.status = JobStatus.RUNNING.value
+        job.started_at = datetime.now(timezone.utc)
+        self._notify(job)
+
+        timer = StageTimer()
+        timer_token = timer.activate()
+        progress_token = inpaint_progress.set(lambda done, total: self._on_progress(job, done, total))
+        try:
+            result = await self.service.remove_watermark(job.image_bytes, job.mask_bytes, encode=job.encode)
+            if result is None:
+                job.status = JobStatus.FAILED.value
+                job.error = "处理失败"
+            else:
+                job.result = result
+                job.total = job.total or 1
+                job.done = job.total
+                job.status = JobStatus.DONE.value
+        except Exception as e:
+            logger.exception(f"去水印任务失败: {job.id}")
+            job.status = JobStatus.FAILED.value
+            job.error = str(e) or "处理失败"
+        finally:
+            inpaint_progress.reset(progress_token)
+            timer.deactivate(timer_token)
+            job.stages = timer.stages
+            stage_metrics.observe_timer(timer)
+            job.image_bytes = job.mask_bytes = None
+            job.finished_at = datetime.now(timezone.utc)
+            self._finish(job)
+
+        logger.info(f"去水印任务 {job.id} {job.status} | {timer.summary()}")
+        self._notify(job)
+
+    def _on_progress(self, job: Job, done: int, total: int) -> None:
+        if job.status != JobStatus.RUNNING.value:
+            return  # process 后端的进度可能晚于结果到达
+        job.done, job.total = done, total
+        self._notify(job)
+
+    def _notify(self, job: Job) -> None:
+        """推送任务状态给提交的客户端（不等待发送完成）"""
+        if not job.client_id:
+            return
+        task = asyncio.get_running_loop().create_task(
+            sse_manager.send_to_client(job.client_id, JOB_EVENT, job.to_dict())
+        )
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
@@ -5,40 +5,126 @@ import io
 import base64
 import asyncio
 import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from dataclasses import dataclass
+from enum import Enum
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Callable
 import numpy as np
 from PIL import Image
 import cv2
 
 from aimultibox.core.config import settings, BASE_DIR, AIMode
+from aimultibox.core.timing import stage
+from .variants import available_variants, resolve_variant
 
 logger = logging.getLogger(__name__)
 
+# 推理进度回调（已完成窗口数, 总窗口数），由异步任务在其上下文中设置
+inpaint_progress: ContextVar[Optional[Callable[[int, int], None]]] = ContextVar("inpaint_progress", default=None)
+
+
+class ModelState(str, Enum):
+    """模型加载状态"""
+    IDLE = "idle"        # 未加载（首次请求时加载）
+    WARMING = "warming"  # 后台预热中
+    READY = "ready"      # 已就绪
+    ERROR = "error"      # 预热未完成（请求仍会尝试处理，成功后恢复为 ready）
+
 
 class WatermarkDetector:
     """
     水印检测器
 
     使用 EasyOCR 检测图片中的文字区域
+    检测在独立的有界线程池中执行，不阻塞事件循环
     """
 
-    def __init__(self):
+    def __init__(self, num_threads: int = 0, max_concurrency: int = 1):
         self._reader = None
+        self._reader_lock = threading.Lock()
+        self.num_threads = num_threads  # torch 线程数，0 表示默认
+        self.max_concurrency = max(1, max_concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="easyocr",
+        )
+
+        # 排队等待指标
+        self._stats_lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._wait_ms_total = 0.0
+        self._wait_ms_max = 0.0
 
     def _get_reader(self):
         """延迟加载 EasyOCR"""
         if self._reader is not None:
             return self._reader
 
+        with self._reader_lock:
+            if self._reader is None:
+                self._reader = self._create_reader()
+        return self._reader
+
+    def _create_reader(self):
         import easyocr
         import torch
 
+        if self.num_threads > 0:
+            torch.set_num_threads(self.num_threads)
+
         gpu_available = torch.cuda.is_available()
         logger.debug(f"正在加载 EasyOCR (GPU: {gpu_available})...")
-        self._reader = easyocr.Reader(['ch_sim', 'en'], gpu=gpu_available, verbose=False)
+        reader = easyocr.Reader(['ch_sim', 'en'], gpu=gpu_available, verbose=False)
         logger.debug("EasyOCR 加载完成")
-        return self._reader
+        return reader
+
+    def warmup(self) -> None:
+        """加载 EasyOCR 并执行一次空白图检测"""
+        reader = self._get_reader()
+        reader.readtext(np.full((64, 256, 3), 255, dtype=np.uint8), detail=1, paragraph=False)
+
+    async def detect_async(self, image: Image.Image) -> List[Dict[str, Any]]:
+        """在检测线程池中执行 detect，记录排队等待时间"""
+        submitted = time.perf_counter()
+
+        def run() -> List[Dict[str, Any]]:
+            self._record_wait((time.perf_counter() - submitted) * 1000)
+            return self.detect(np.array(image.convert('RGB')))
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, run)
+        finally:
+            self._pending -= 1
+
+    def _record_wait(self, wait_ms: float) -> None:
+        with self._stats_lock:
+            self._completed += 1
+            self._wait_ms_total += wait_ms
+            self._wait_ms_max = max(self._wait_ms_max, wait_ms)
+        if wait_ms > 1000:
+            logger.warning(f"EasyOCR 排队等待 {wait_ms:.0f}ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """检测队列指标"""
+        with self._stats_lock:
+            completed = self._completed
+            return {
+                "concurrency": self.max_concurrency,
+                "pending": self._pending,
+                "completed": completed,
+                "queue_wait_ms_avg": round(self._wait_ms_total / completed, 1) if completed else 0.0,
+                "queue_wait_ms_max": round(self._wait_ms_max, 1),
+            }
 
     def detect(self, image: np.ndarray) -> List[Dict[str, Any]]:
         """检测水印区域"""
@@ -75,6 +161,202 @@ class WatermarkDetector:
         return regions[:5]
 
 
+@dataclass
+class _BoundBuffers:
+    """IOBinding 预分配输入缓冲（绑定一次，按 batch 大小复用）"""
+    image: np.ndarray
+    mask: np.ndarray
+    binding: Any
+
+
+class _TensorPool:
+    """
+    输入张量池
+
+    预处理直接写入从池中取出的缓冲，推理完成后归还，避免每个分块重新分配
+    """
+
+    def __init__(self, max_per_shape: int = 8):
+        self.max_per_shape = max_per_shape
+        self._free: Dict[Tuple[Tuple[int, ...], str], List[np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, shape: Tuple[int, ...], dtype: Any = np.float32) -> np.ndarray:
+        key = (shape, np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                return free.pop()
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, *arrays: np.ndarray) -> None:
+        with self._lock:
+            for array in arrays:
+                free = self._free.setdefault((array.shape, array.dtype.str), [])
+                if len(free) < self.max_per_shape:
+                    free.append(array)
+
+
+class InferenceBatcher:
+    """
+    推理微批队列
+
+    收集并发请求的待推理块，在短时间窗口内合并为一个 NCHW batch，
+    在线程池中执行一次推理后将结果分发回各自的等待协程
+
+    run_batch 接收各请求的 1xCxHxW 输入列表（在线程池中合并），返回 NxCxHxW 输出
+
+    enabled 为 False 时（模型 batch 维度固定为 1，合批只会排队逐个执行）不经过队列，
+    每个请求直接在线程池中推理，并发请求互不等待
+    """
+
+    def __init__(self, run_batch: Callable[[List[np.ndarray], List[np.ndarray]], np.ndarray],
+                 max_batch_size: int = 4, max_wait_ms: float = 5):
+        self._run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.enabled = True
+
+    async def submit(self, img_tensor: np.ndarray, mask_tensor: np.ndarray) -> np.ndarray:
+        """提交单个 1xCxHxW 输入，返回对应的 1xCxHxW 输出"""
+        loop = asyncio.get_running_loop()
+        if not self.enabled:
+            return await loop.run_in_executor(None, self._run_batch, [img_tensor], [mask_tensor])
+
+        self._ensure_worker(loop)
+
+        future = loop.create_future()
+        await self._queue.put((img_tensor, mask_tensor, future))
+        return await future
+
+    def _ensure_worker(self, loop: asyncio.AbstractEventLoop) -> None:
+        """按事件循环启动消费协程"""
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._worker = loop.create_task(self._consume())
+
+    async def _consume(self) -> None:
+        """收集一批请求后统一推理"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout <= 0:
+                        batch.append(self._queue.get_nowait())
+                    else:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+
+            await self._dispatch(batch)
+
+    async def _dispatch(self, batch: List[Tuple[np.ndarray, np.ndarray, asyncio.Future]]) -> None:
+        """执行推理并分发结果"""
+        batch = [item for item in batch if not item[2].done()]
+        if not batch:
+            return
+
+        img_list = [item[0] for item in batch]
+        mask_list = [item[1] for item in batch]
+
+        loop = asyncio.get_running_loop()
+        try:
+            outputs = await loop.run_in_executor(None, self._run_batch, img_list, mask_list)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for i, (_, _, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(outputs[i:i + 1])
+
+
+class FeatherBlender:
+    """
+    羽化融合器
+
+    - 结果原地写入目标数组，不复制整图
+    - float32 临时缓冲按块尺寸复用（线程私有，可并发调用）
+    - 高斯羽化核按羽化大小缓存，可分离卷积计算
+    """
+
+    MAX_CACHED_SHAPES = 8  # 每个线程最多缓存的缓冲尺寸数
+
+    def __init__(self, feather_size: int = 16):
+        self.feather_size = feather_size
+        self._local = threading.local()
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _gaussian_kernel(ksize: int) -> np.ndarray:
+        """一维高斯核（sigma 与 cv2.GaussianBlur 默认一致）"""
+        return cv2.getGaussianKernel(ksize, 0).astype(np.float32)
+
+    def _buffers(self, h: int, w: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """获取当前线程 (h, w) 尺寸的临时缓冲"""
+        cache = getattr(self._local, "buffers", None)
+        if cache is None:
+            cache = self._local.buffers = {}
+
+        buffers = cache.get((h, w))
+        if buffers is None:
+            if len(cache) >= self.MAX_CACHED_SHAPES:
+                cache.clear()
+            buffers = (
+                np.empty((h, w), dtype=np.float32),     # 二值 mask
+                np.empty((h, w), dtype=np.float32),     # 羽化 alpha
+                np.empty((h, w, 3), dtype=np.float32),  # 混合结果
+            )
+            cache[(h, w)] = buffers
+        return buffers
+
+    def feather(self, mask: np.ndarray) -> np.ndarray:
+        """
+        创建羽化遮罩（0-1）
+        返回线程缓冲的视图，下次同尺寸调用前有效
+        """
+        h, w = mask.shape[:2]
+        binary, alpha, _ = self._buffers(h, w)
+
+        # 二值化 mask
+        np.greater(mask, 127, out=binary, casting="unsafe")
+
+        # 高斯模糊实现羽化边缘
+        kernel = self._gaussian_kernel(self.feather_size * 2 + 1)
+        cv2.sepFilter2D(binary, -1, kernel, kernel, dst=alpha)
+
+        # 确保 mask 中心区域完全是 1
+        np.maximum(alpha, binary, out=alpha)
+        return alpha
+
+    def blend(self, target: np.ndarray, inpainted: np.ndarray,
+              mask: np.ndarray, x: int, y: int) -> None:
+        """
+        使用羽化遮罩将 inpainted 混合到 target[y:y+h, x:x+w]
+        target = target + (inpainted - target) * alpha
+        """
+        h, w = inpainted.shape[:2]
+        alpha = self.feather(mask)
+        _, _, blended = self._buffers(h, w)
+
+        target_crop = target[y:y+h, x:x+w]
+        np.subtract(inpainted, target_crop, out=blended, dtype=np.float32)
+        blended *= alpha[:, :, np.newaxis]
+        blended += target_crop
+        np.copyto(target_crop, blended, casting="unsafe")
+
+
 class LaMaInpainter:
     """
     LaMa 本地推理 (ONNX)
@@ -82,18 +364,43 @@ class LaMaInpainter:
     特性：
     - 智能局部处理，不缩放整图
     - 边界羽化融合，无明显接缝
+    - 分散的多个水印按连通域分别裁剪
     - 大区域分块处理
     """
 
+    MAX_REGION_COMPONENTS = 64  # 按连通域拆分的最大连通域数
+    REGION_SCALE = 4  # 连通域分析的降采样倍数
+
     def __init__(self):
         self.session = None
         self.loaded = False
         self.input_size = 512
         self.padding = 32
         self.feather_size = 16  # 羽化边界大小
+        self.tile_overlap = 64  # 分块重叠大小
+        self.blender = FeatherBlender(self.feather_size)
+        self.dynamic_batch = False  # 模型是否支持动态 batch 维度
+        self.input_dtype = np.float32
+        self._feeds: List[Tuple[str, bool]] = []  # (输入名, 是否为 mask)，加载时解析
+        self._output_name: Optional[str] = None
+        self._output_dtype = np.float32
+        self._bindings: Dict[int, _BoundBuffers] = {}  # batch 大小 -> 预分配并绑定的输入缓冲
+        self._binding_lock = threading.Lock()
+        self._tensor_pool = _TensorPool(max_per_shape=2 * settings.watermark_batch_size)
+        self._local = threading.local()
+        self.batcher = InferenceBatcher(
+            self._run_batch,
+            max_batch_size=settings.watermark_batch_size,
+            max_wait_ms=settings.watermark_batch_wait_ms,
+        )
+
+    def load(self, model_path: Path, intra_op_threads: int = 0) -> bool:
+        """
+        加载模型
 
-    def load(self, model_path: Path) -> bool:
-        """加载模型"""
+        会话参数见 _session_options（watermark_ort_* 配置）；
+        intra_op_threads 大于 0 时覆盖配置的线程数（process 后端按 worker 分配）
+        """
         try:
             import onnxruntime as ort
 
@@ -108,17 +415,49 @@ class LaMaInpainter:
                 logger.info("CoreML 可用")
             providers.append('CPUExecutionProvider')
 
-            sess_options = ort.SessionOptions()
-            sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            sess_options = self._session_options(ort, intra_op_threads)
+
+            # 优化后的图缓存到磁盘，重启时跳过图优化
+            load_path = model_path
+            optimized_path = self._optimized_model_path(ort, model_path, providers)
+            optimized_tmp = None
+            if optimized_path is not None:
+                if (optimized_path.exists()
+                        and optimized_path.stat().st_mtime >= model_path.stat().st_mtime):
+                    load_path = optimized_path
+                    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+                else:
+                    optimized_path.parent.mkdir(parents=True, exist_ok=True)
+                    optimized_tmp = optimized_path.with_suffix(f".{os.getpid()}.tmp")
+                    sess_options.optimized_model_filepath = str(optimized_tmp)
+
+            try:
+                self.session = ort.InferenceSession(
+                    str(load_path),
+                    sess_options=sess_options,
+                    providers=providers
+                )
+            except Exception:
+                if load_path == model_path:
+                    raise
+                # 缓存的优化图不可用时删除并从原模型重新加载
+                logger.warning(f"优化模型缓存无效，已删除: {optimized_path.name}")
+                optimized_path.unlink(missing_ok=True)
+                return self.load(model_path, intra_op_threads)
 
-            self.session = ort.InferenceSession(
-                str(model_path),
-                sess_options=sess_options,
-                providers=providers
-            )
+            if optimized_tmp is not None and optimized_tmp.exists():
+                os.replace(optimized_tmp, optimized_path)
+
+            self._resolve_io()
 
             self.loaded = True
-            logger.info(f"LaMa 已加载: {model_path.name}")
+            logger.info(
+                f"LaMa 已加载: {model_path.name} "
+                f"(intra: {sess_options.intra_op_num_threads or 'auto'}, "
+                f"inter: {sess_options.inter_op_num_threads or 'auto'}, "
+                f"mode: {settings.watermark_ort_execution_mode}"
+                f"{', optimized cache' if load_path != model_path else ''})"
+            )
             return True
 
         except ImportError:
@@ -128,6 +467,63 @@ class LaMaInpainter:
             logger.error(f"LaMa 加载失败: {e}")
             return False
 
+    def _resolve_io(self) -> None:
+        """加载时解析输入输出名称与类型，推理时不再逐次查询"""
+        inputs = self.session.get_inputs()
+        # 根据输入名称匹配正确的 tensor
+        self._feeds = [(inp.name, 'mask' in inp.name.lower()) for inp in inputs]
+
+        model_output = self.session.get_outputs()[0]
+        self._output_name = model_output.name
+        self._output_dtype = np.float16 if model_output.type == "tensor(float16)" else np.float32
+
+        model_input = inputs[0]
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        self.batcher.enabled = self.dynamic_batch and self.batcher.max_batch_size > 1
+        # fp16 变体（未保留 float32 输入输出时）需要半精度输入
+        self.input_dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+        self._bindings = {}
+
+    def _session_options(self, ort, intra_op_threads: int = 0):
+        """按 watermark_ort_* 配置构建会话参数"""
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        intra = intra_op_threads or settings.watermark_ort_intra_threads
+        if intra > 0:
+            sess_options.intra_op_num_threads = intra
+        if settings.watermark_ort_inter_threads > 0:
+            sess_options.inter_op_num_threads = settings.watermark_ort_inter_threads
+
+        if settings.watermark_ort_execution_mode == "parallel":
+            sess_options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        else:
+            sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+
+        sess_options.enable_cpu_mem_arena = settings.watermark_ort_mem_arena
+        sess_options.enable_mem_pattern = settings.watermark_ort_mem_pattern
+        if not settings.watermark_ort_allow_spinning:
+            # 多进程部署时关闭线程自旋等待，避免空转抢占 CPU
+            sess_options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+            sess_options.add_session_config_entry("session.inter_op.allow_spinning", "0")
+        return sess_options
+
+    @staticmethod
+    def _optimized_model_path(ort, model_path: Path, providers: List[str]) -> Optional[Path]:
+        """优化图缓存路径（与 onnxruntime 版本、首选 provider 绑定），未启用时返回 None"""
+        if not settings.watermark_ort_cache_optimized:
+            return None
+        provider = providers[0].replace("ExecutionProvider", "").lower()
+        return model_path.parent / "optimized" / f"{model_path.stem}.{provider}.ort{ort.__version__}.onnx"
+
+    def warmup(self) -> None:
+        """执行一次 512x512 空推理，提前完成图优化与内存分配"""
+        size = self.input_size
+        self._run_inference(
+            np.zeros((1, 3, size, size), dtype=np.float32),
+            np.zeros((1, 1, size, size), dtype=np.float32),
+        )
+
     def _get_mask_bbox(self, mask: np.ndarray) -> Tuple[int, int, int, int]:
         """获取 mask 的 bounding box"""
         rows = np.any(mask > 127, axis=1)
@@ -165,108 +561,132 @@ class LaMaInpainter:
 
         return x, y, w, h
 
-    def _create_feather_mask(self, mask: np.ndarray, feather_size: int) -> np.ndarray:
-        """
-        创建羽化遮罩
-        用于边界平滑融合
-        """
-        # 二值化 mask
-        mask_binary = (mask > 127).astype(np.uint8) * 255
-
-        # 高斯模糊实现羽化边缘
-        ksize = feather_size * 2 + 1
-        feathered = cv2.GaussianBlur(mask_binary.astype(np.float32), (ksize, ksize), 0)
-
-        # 归一化到 0-1
-        feathered = feathered / 255.0
-
-        # 确保 mask 中心区域完全是 1
-        feathered = np.where(mask_binary > 127, 1.0, feathered)
-
-        return feathered
+    def _thread_buffer(self, name: str, shape: Tuple[int, ...], dtype: Any) -> np.ndarray:
+        """当前线程私有的临时缓冲（按名称复用）"""
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buffer = buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = buffers[name] = np.empty(shape, dtype=dtype)
+        return buffer
 
     def _prepare_input(self, img_crop: np.ndarray, mask_crop: np.ndarray) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
-        """准备模型输入"""
-        h, w = img_crop.shape[:2]
-
-        if h == self.input_size and w == self.input_size:
-            img_norm = img_crop.astype(np.float32) / 255.0
-            mask_norm = (mask_crop > 127).astype(np.float32)
-
-            img_tensor = np.transpose(img_norm, (2, 0, 1))[np.newaxis, ...]
-            mask_tensor = mask_norm[np.newaxis, np.newaxis, ...]
-
-            return img_tensor, mask_tensor, (h, w)
+        """
+        准备模型输入
 
-        # 填充到 512x512
-        pad_h = self.input_size - h
-        pad_w = self.input_size - w
+        归一化的 CHW 数据直接写入张量池缓冲（推理完成后由 _run_batch 归还），
+        不足 512 时右侧 / 下方反射填充（BORDER_REFLECT_101，与 np.pad reflect 一致），mask 填充 0
+        """
+        h, w = img_crop.shape[:2]
+        size = self.input_size
+        img_tensor = self._tensor_pool.acquire((1, 3, size, size))
+        mask_tensor = self._tensor_pool.acquire((1, 1, size, size))
 
-        img_padded = np.pad(img_crop, ((0, pad_h), (0, pad_w), (0, 0)), mode='reflect')
-        mask_padded = np.pad(mask_crop, ((0, pad_h), (0, pad_w)), mode='constant', constant_values=0)
+        if h != size or w != size:
+            padded = self._thread_buffer("padded", (size, size, 3), np.uint8)
+            img_crop = cv2.copyMakeBorder(img_crop, 0, size - h, 0, size - w, cv2.BORDER_REFLECT_101, dst=padded)
 
-        img_norm = img_padded.astype(np.float32) / 255.0
-        mask_norm = (mask_padded > 127).astype(np.float32)
+        # HWC -> CHW 由 cv2.split 完成（比 numpy 跨步转置快），再整块归一化
+        planes = self._thread_buffer("planes", (3, size, size), np.uint8)
+        cv2.split(img_crop, [planes[0], planes[1], planes[2]])
+        np.divide(planes, np.float32(255), out=img_tensor[0])
 
-        img_tensor = np.transpose(img_norm, (2, 0, 1))[np.newaxis, ...]
-        mask_tensor = mask_norm[np.newaxis, np.newaxis, ...]
+        mask_plane = mask_tensor[0, 0]
+        np.greater(mask_crop, 127, out=mask_plane[:h, :w])
+        mask_plane[h:, :] = 0
+        mask_plane[:h, w:] = 0
 
         return img_tensor, mask_tensor, (h, w)
 
-    def _run_inference(self, img_tensor: np.ndarray, mask_tensor: np.ndarray) -> np.ndarray:
-        """执行模型推理"""
-        inputs = self.session.get_inputs()
-        outputs_meta = self.session.get_outputs()
+    def _run_batch(self, img_list: List[np.ndarray], mask_list: List[np.ndarray]) -> np.ndarray:
+        """微批推理入口（线程池中执行）：合并输入后推理，完成后归还输入缓冲"""
+        try:
+            if settings.watermark_ort_io_binding:
+                return self._run_bound(img_list, mask_list)
+            if len(img_list) == 1:
+                return self._run_inference(img_list[0], mask_list[0])
+            return self._run_inference(np.concatenate(img_list, axis=0), np.concatenate(mask_list, axis=0))
+        finally:
+            self._tensor_pool.release(*img_list, *mask_list)
 
-        # 根据输入名称匹配正确的 tensor
-        feed_dict = {}
-        for inp in inputs:
-            name_lower = inp.name.lower()
-            if 'mask' in name_lower:
-                feed_dict[inp.name] = mask_tensor
-            else:
-                feed_dict[inp.name] = img_tensor
+    def _run_inference(self, img_tensor: np.ndarray, mask_tensor: np.ndarray) -> np.ndarray:
+        """执行模型推理（固定 batch=1 的模型逐个执行）"""
+        if settings.watermark_ort_io_binding:
+            return self._run_bound([img_tensor], [mask_tensor])
+
+        if not self.dynamic_batch and img_tensor.shape[0] > 1:
+            return np.concatenate([
+                self._run_inference(img_tensor[i:i + 1], mask_tensor[i:i + 1])
+                for i in range(img_tensor.shape[0])
+            ], axis=0)
+
+        if self.input_dtype != np.float32:
+            img_tensor = img_tensor.astype(self.input_dtype)
+            mask_tensor = mask_tensor.astype(self.input_dtype)
+
+        feed_dict = {
+            name: mask_tensor if is_mask else img_tensor
+            for name, is_mask in self._feeds
+        }
+        return self.session.run([self._output_name], feed_dict)[0]
+
+    def _run_bound(self, img_list: List[np.ndarray], mask_list: List[np.ndarray]) -> np.ndarray:
+        """
+        IOBinding 推理：输入直接合并进预分配并已绑定的缓冲，输出由模型直接写入返回的数组
 
-        output_names = [out.name for out in outputs_meta]
-        outputs = self.session.run(output_names, feed_dict)
+        输出会被各请求在推理返回后继续使用，不能复用；每次绑定新数组，省去 session.run 的输出复制
+        """
+        if not self.dynamic_batch and len(img_list) > 1:
+            return np.concatenate([
+                self._run_bound(img_list[i:i + 1], mask_list[i:i + 1])
+                for i in range(len(img_list))
+            ], axis=0)
+
+        with self._binding_lock:
+            buffers = self._get_bound_buffers(len(img_list), img_list[0].shape[2:])
+            np.concatenate(img_list, axis=0, out=buffers.image)
+            np.concatenate(mask_list, axis=0, out=buffers.mask)
+            output = np.empty((len(img_list), 3, *buffers.image.shape[2:]), dtype=self._output_dtype)
+            buffers.binding.bind_output(
+                self._output_name, "cpu", 0, output.dtype, list(output.shape), output.ctypes.data
+            )
+            self.session.run_with_iobinding(buffers.binding)
+            return output
 
-        return outputs[0]
+    def _get_bound_buffers(self, batch: int, size: Tuple[int, int]) -> "_BoundBuffers":
+        """按 batch 大小获取（或创建并绑定）输入输出缓冲"""
+        buffers = self._bindings.get(batch)
+        if buffers is not None and buffers.image.shape[2:] == size:
+            return buffers
 
-    def _process_output(self, output: np.ndarray, crop_size: Tuple[int, int]) -> np.ndarray:
-        """处理模型输出"""
-        result = output[0]
-        result = np.transpose(result, (1, 2, 0))
+        height, width = size
+        image = np.empty((batch, 3, height, width), dtype=self.input_dtype)
+        mask = np.empty((batch, 1, height, width), dtype=self.input_dtype)
 
-        h, w = crop_size
-        result = result[:h, :w, :]
-        result = np.clip(result, 0, 255).astype(np.uint8)
+        binding = self.session.io_binding()
+        for name, is_mask in self._feeds:
+            array = mask if is_mask else image
+            binding.bind_input(name, "cpu", 0, array.dtype, list(array.shape), array.ctypes.data)
 
-        return result
+        buffers = _BoundBuffers(image=image, mask=mask, binding=binding)
+        self._bindings[batch] = buffers
+        return buffers
 
-    def _blend_result(self, original: np.ndarray, inpainted: np.ndarray,
-                      mask: np.ndarray, x: int, y: int) -> np.ndarray:
+    def _process_output(self, output: np.ndarray, crop_size: Tuple[int, int]) -> np.ndarray:
         """
-        使用羽化遮罩混合结果
-        实现无缝融合
+        处理模型输出：裁剪、截断到 0-255 并转为 uint8，一次写入结果数组
+        返回 HWC 视图（内存保持 CHW 布局，不做转置复制）
         """
-        h, w = inpainted.shape[:2]
-
-        # 创建羽化遮罩
-        feather_mask = self._create_feather_mask(mask, self.feather_size)
-
-        # 扩展到 3 通道
-        feather_mask_3d = feather_mask[:, :, np.newaxis]
-
-        # 混合
-        original_crop = original[y:y+h, x:x+w].astype(np.float32)
-        inpainted_f = inpainted.astype(np.float32)
-
-        blended = original_crop * (1 - feather_mask_3d) + inpainted_f * feather_mask_3d
-
-        result = original.copy()
-        result[y:y+h, x:x+w] = blended.astype(np.uint8)
+        h, w = crop_size
+        result = np.empty((3, h, w), dtype=np.uint8)
+        np.clip(output[0, :, :h, :w], 0, 255, out=result, casting="unsafe")
+        return result.transpose(1, 2, 0)
 
-        return result
+    def _blend_into(self, target: np.ndarray, inpainted: np.ndarray,
+                    mask: np.ndarray, x: int, y: int) -> None:
+        """将修复结果羽化混合写回 target 的对应区域（原地修改）"""
+        self.blender.blend(target, inpainted, mask, x, y)
 
     async def inpaint(self, image: Image.Image, mask: Image.Image) -> Optional[Image.Image]:
         """执行图像修复"""
@@ -295,90 +715,224 @@ class LaMaInpainter:
                 bbox_x, bbox_y, bbox_w, bbox_h, img_w, img_h
             )
 
-            # 如果裁剪区域 > 512，分块处理
+            # 如果裁剪区域 > 512，按连通域拆分或分块处理（取推理次数较少者）
             if crop_w > self.input_size or crop_h > self.input_size:
-                return await self._inpaint_tiled(img_array, mask_array,
-                                                  crop_x, crop_y, crop_w, crop_h)
+                windows = self._plan_tiles(mask_array, crop_x, crop_y, crop_w, crop_h)
+                regions = self._plan_regions(mask_array, (bbox_x, bbox_y, bbox_w, bbox_h))
+                if regions is not None and len(regions) < len(windows):
+                    windows = regions
+                return await self._inpaint_windows(img_array, mask_array, windows)
 
             # 裁剪局部区域
             img_crop = img_array[crop_y:crop_y+crop_h, crop_x:crop_x+crop_w]
             mask_crop = mask_array[crop_y:crop_y+crop_h, crop_x:crop_x+crop_w]
 
             # 准备输入
-            img_tensor, mask_tensor, crop_size = self._prepare_input(img_crop, mask_crop)
+            with stage("prepare"):
+                img_tensor, mask_tensor, crop_size = self._prepare_input(img_crop, mask_crop)
 
-            # 异步推理
-            loop = asyncio.get_event_loop()
-            output = await loop.run_in_executor(
-                None, lambda: self._run_inference(img_tensor, mask_tensor)
-            )
+            # 微批推理（含排队等待）
+            with stage("inference"):
+                output = await self.batcher.submit(img_tensor, mask_tensor)
+            progress = inpaint_progress.get()
+            if progress is not None:
+                progress(1, 1)
 
-            # 处理输出
-            result_crop = self._process_output(output, crop_size)
+            with stage("blend"):
+                # 处理输出
+                result_crop = self._process_output(output, crop_size)
 
-            # 羽化混合
-            result_array = self._blend_result(img_array, result_crop, mask_crop, crop_x, crop_y)
+                # 羽化混合（img_array 为本次请求私有副本，直接作为输出缓冲）
+                self._blend_into(img_array, result_crop, mask_crop, crop_x, crop_y)
 
-            return Image.fromarray(result_array)
+            return Image.fromarray(img_array)
 
         except Exception:
+            logger.exception("LaMa 推理失败")
             return None
 
-    async def _inpaint_tiled(self, img_array: np.ndarray, mask_array: np.ndarray,
-                             crop_x: int, crop_y: int,
-                             crop_w: int, crop_h: int) -> Optional[Image.Image]:
-        """
-        分块处理大区域
-        带羽化边界融合
-        """
-        result_array = img_array.copy()
+    def _plan_tiles(self, mask_array: np.ndarray,
+                    crop_x: int, crop_y: int,
+                    crop_w: int, crop_h: int) -> List[Tuple[int, int, int, int]]:
+        """规划需要推理的分块（跳过不含水印的块）"""
         tile_size = self.input_size
-        overlap = 64
-
-        img_h, img_w = img_array.shape[:2]
+        stride = tile_size - self.tile_overlap
+        img_h, img_w = mask_array.shape[:2]
 
-        y = crop_y
-        while y < crop_y + crop_h:
-            x = crop_x
-            while x < crop_x + crop_w:
-                tile_x = max(0, x)
-                tile_y = max(0, y)
+        tiles = []
+        for tile_y in range(crop_y, crop_y + crop_h, stride):
+            for tile_x in range(crop_x, crop_x + crop_w, stride):
                 tile_w = min(tile_size, img_w - tile_x)
                 tile_h = min(tile_size, img_h - tile_y)
 
-                # 检查是否有水印区域
                 mask_tile = mask_array[tile_y:tile_y+tile_h, tile_x:tile_x+tile_w]
                 if np.sum(mask_tile > 127) < 10:
-                    x += tile_size - overlap
                     continue
 
-                img_tile = img_array[tile_y:tile_y+tile_h, tile_x:tile_x+tile_w]
+                tiles.append((tile_x, tile_y, tile_w, tile_h))
 
-                # 准备输入
-                img_tensor, mask_tensor, tile_actual_size = self._prepare_input(img_tile, mask_tile)
+        return tiles
 
-                # 推理
-                output = self._run_inference(img_tensor, mask_tensor)
+    def _plan_regions(self, mask_array: np.ndarray,
+                      bbox: Tuple[int, int, int, int]) -> Optional[List[Tuple[int, int, int, int]]]:
+        """
+        按连通域规划推理窗口（多个分散的小水印各自裁剪，而不是对整体 bbox 分块）
 
-                # 处理输出
-                result_tile = self._process_output(output, tile_actual_size)
+        相近的连通域合并为一组（组 bbox 加 padding 后不超过模型输入尺寸），
+        每组扩展为一个窗口；单个连通域超过尺寸时对其分块。
+        连通域过多（如大段文字）时返回 None，由调用方使用整体分块
+        """
+        img_h, img_w = mask_array.shape[:2]
+        bx, by, bw, bh = bbox
+        _, binary = cv2.threshold(mask_array[by:by+bh, bx:bx+bw], 127, 255, cv2.THRESH_BINARY)
+
+        # 在 1/REGION_SCALE 分辨率上求连通域（只需粗略 bbox，缩小后按块取“任一像素”）
+        scale = self.REGION_SCALE
+        small = cv2.resize(binary, ((bw + scale - 1) // scale, (bh + scale - 1) // scale),
+                           interpolation=cv2.INTER_AREA)
+        count, _, stats, _ = cv2.connectedComponentsWithStats((small > 0).view(np.uint8), connectivity=8)
+        if count - 1 > self.MAX_REGION_COMPONENTS:
+            return None
 
-                # 羽化混合贴回
-                result_array = self._blend_result(result_array, result_tile, mask_tile, tile_x, tile_y)
+        # 映射回原图坐标后按位置排序，first-fit 合并
+        limit = self.input_size - 2 * self.padding
+        boxes = sorted(
+            (by + int(y) * scale, bx + int(x) * scale,
+             min(bx + bw, bx + int(x + w) * scale), min(by + bh, by + int(y + h) * scale))
+            for x, y, w, h, _ in stats[1:]
+        )
+        groups: List[List[int]] = []
+        for top, left, right, bottom in boxes:
+            for group in groups:
+                x0, y0 = min(group[0], left), min(group[1], top)
+                x1, y1 = max(group[2], right), max(group[3], bottom)
+                if x1 - x0 <= limit and y1 - y0 <= limit:
+                    group[:] = [x0, y0, x1, y1]
+                    break
+            else:
+                groups.append([left, top, right, bottom])
 
-                x += tile_size - overlap
-            y += tile_size - overlap
+        windows = []
+        for x0, y0, x1, y1 in groups:
+            crop_x, crop_y, crop_w, crop_h = self._expand_bbox(x0, y0, x1 - x0, y1 - y0, img_w, img_h)
+            if crop_w > self.input_size or crop_h > self.input_size:
+                windows.extend(self._plan_tiles(mask_array, crop_x, crop_y, crop_w, crop_h))
+            else:
+                windows.append((crop_x, crop_y, crop_w, crop_h))
+        return windows
 
-        return Image.fromarray(result_array)
+    async def _inpaint_windows(self, img_array: np.ndarray, mask_array: np.ndarray,
+                               tiles: List[Tuple[int, int, int, int]]) -> Optional[Image.Image]:
+        """
+        处理多个推理窗口（分块或连通域裁剪）
+        所有窗口合并为批次推理，结果统一羽化融合回 img_array（原地）
+        """
+        prepared = []
+        with stage("prepare"):
+            for tile_x, tile_y, tile_w, tile_h in tiles:
+                img_tile = img_array[tile_y:tile_y+tile_h, tile_x:tile_x+tile_w]
+                mask_tile = mask_array[tile_y:tile_y+tile_h, tile_x:tile_x+tile_w]
+                prepared.append(self._prepare_input(img_tile, mask_tile))
+
+        # 批量推理（按 watermark_batch_size 分批，在线程池中执行）
+        progress = inpaint_progress.get()
+        done = 0
+
+        async def infer(img_tensor: np.ndarray, mask_tensor: np.ndarray) -> np.ndarray:
+            nonlocal done
+            output = await self.batcher.submit(img_tensor, mask_tensor)
+            if progress is not None:
+                done += 1
+                progress(done, len(prepared))
+            return output
+
+        with stage("inference"):
+            outputs = await asyncio.gather(*[
+                infer(img_tensor, mask_tensor)
+                for img_tensor, mask_tensor, _ in prepared
+            ])
+
+        def blend_all() -> None:
+            for (tile_x, tile_y, tile_w, tile_h), output, (_, _, tile_actual_size) in zip(tiles, outputs, prepared):
+                result_tile = self._process_output(output, tile_actual_size)
+                mask_tile = mask_array[tile_y:tile_y+tile_h, tile_x:tile_x+tile_w]
+                self._blend_into(img_array, result_tile, mask_tile, tile_x, tile_y)
+
+        loop = asyncio.get_running_loop()
+        with stage("blend"):
+            await loop.run_in_executor(None, blend_all)
+
+        return Image.fromarray(img_array)
 
 
 class SDXLInpainter:
-    """SDXL 云端推理 (Replicate API)"""
+    """
+    SDXL 云端推理 (Replicate API)
+
+    - 共享连接池的 AsyncClient（keep-alive，安装 h2 时启用 HTTP/2），按事件循环创建
+    - 创建预测时携带 Prefer: wait，多数请求在同一响应内完成；未完成时按指数退避轮询
+    """
 
     MODEL_VERSION = "stability-ai/stable-diffusion-inpainting:95b7223104132402a9ae91cc677285bc5eb997834bd2349fa486f53910fd68b3"
+    MAX_SIZE = 1024  # 上传前缩放到的最大边长
+    POLL_INITIAL = 0.5  # 首次轮询间隔（秒）
+    POLL_MAX = 2.0  # 最大轮询间隔（秒）
+    POLL_BACKOFF = 1.5
 
-    def __init__(self, api_token: str):
+    def __init__(self, api_token: str, base_url: Optional[str] = None, transport: Any = None):
         self.api_token = api_token
+        self.base_url = (base_url or settings.replicate_base_url).rstrip("/")
+        self._transport = transport  # 测试 / 基准时注入（如 httpx.ASGITransport）
+        self._client = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.poll_count = 0  # 累计轮询次数
+
+    async def _get_client(self):
+        """当前事件循环的共享客户端（process 后端每个 worker 有独立的事件循环）"""
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._client_loop is loop and not self._client.is_closed:
+            return self._client
+
+        # 先替换再关闭旧客户端：检查与赋值之间没有 await，同一事件循环的并发调用不会各建一个客户端
+        stale, stale_loop = self._client, self._client_loop
+        self._client = httpx.AsyncClient(
+            http2=self._transport is None and _h2_available(),
+            transport=self._transport,
+            timeout=httpx.Timeout(settings.replicate_timeout, connect=10),
+            limits=httpx.Limits(
+                max_connections=settings.replicate_max_connections,
+                max_keepalive_connections=settings.replicate_max_connections,
+                keepalive_expiry=60,
+            ),
+            headers={"Authorization": f"Bearer {self.api_token}"},
+        )
+        self._client_loop = loop
+        client = self._client
+        if stale is not None:
+            await self._close_client(stale, stale_loop)
+        return client
+
+    @staticmethod
+    async def _close_client(client, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """关闭其他事件循环创建的客户端（连接属于原事件循环，原事件循环仍在运行时在其中关闭）"""
+        if client.is_closed:
+            return
+        try:
+            if loop is not None and loop.is_running() and loop is not asyncio.get_running_loop():
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.aclose(), loop))
+            else:
+                await client.aclose()
+        except Exception as e:
+            logger.debug(f"关闭旧的 Replicate 客户端失败: {e}")
+
+    async def close(self) -> None:
+        if self._client is not None:
+            client, loop = self._client, self._client_loop
+            self._client = None
+            self._client_loop = None
+            await self._close_client(client, loop)
 
     async def inpaint(
         self,
@@ -401,7 +955,7 @@ class SDXLInpainter:
             if mask.mode != 'L':
                 mask = mask.convert('L')
 
-            max_size = 1024
+            max_size = self.MAX_SIZE
             original_size = image.size
 
             if image.width > max_size or image.height > max_size:
@@ -413,61 +967,48 @@ class SDXLInpainter:
             image_uri = image_to_data_uri(image)
             mask_uri = image_to_data_uri(mask)
 
-            async with httpx.AsyncClient(timeout=180) as client:
-                response = await client.post(
-                    "https://api.replicate.com/v1/predictions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_token}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "version": self.MODEL_VERSION.split(":")[-1],
-                        "input": {
-                            "image": image_uri,
-                            "mask": mask_uri,
-                            "prompt": prompt,
-                            "negative_prompt": "watermark, text, logo, blurry, low quality",
-                            "num_inference_steps": 30,
-                            "guidance_scale": 7.5,
-                        }
+            client = await self._get_client()
+            headers = {}
+            if settings.replicate_wait_seconds > 0:
+                headers["Prefer"] = f"wait={settings.replicate_wait_seconds}"
+
+            response = await client.post(
+                f"{self.base_url}/predictions",
+                headers=headers,
+                json={
+                    "version": self.MODEL_VERSION.split(":")[-1],
+                    "input": {
+                        "image": image_uri,
+                        "mask": mask_uri,
+                        "prompt": prompt,
+                        "negative_prompt": "watermark, text, logo, blurry, low quality",
+                        "num_inference_steps": 30,
+                        "guidance_scale": 7.5,
                     }
-                )
-
-                if response.status_code != 201:
-                    logger.error(f"Replicate API 错误: {response.status_code}")
-                    return None
-
-                prediction = response.json()
-                prediction_id = prediction["id"]
-
-                for i in range(90):
-                    await asyncio.sleep(1)
-
-                    status_response = await client.get(
-                        f"https://api.replicate.com/v1/predictions/{prediction_id}",
-                        headers={"Authorization": f"Bearer {self.api_token}"}
-                    )
+                }
+            )
 
-                    status = status_response.json()
+            if response.status_code not in (200, 201):
+                logger.error(f"Replicate API 错误: {response.status_code}")
+                return None
 
-                    if status["status"] == "succeeded":
-                        output = status.get("output")
-                        if output:
-                            output_url = output[0] if isinstance(output, list) else output
-                            img_response = await client.get(output_url)
-                            result = Image.open(io.BytesIO(img_response.content))
+            status = await self._wait_prediction(client, response.json())
+            if status is None:
+                return None
 
-                            if result.size != original_size:
-                                result = result.resize(original_size, Image.Resampling.LANCZOS)
+            output = status.get("output")
+            if not output:
+                return None
 
-                            return result
-                        break
+            output_url = output[0] if isinstance(output, list) else output
+            img_response = await client.get(output_url)
+            img_response.raise_for_status()
+            result = Image.open(io.BytesIO(img_response.content))
 
-                    elif status["status"] == "failed":
-                        logger.error(f"SDXL 处理失败: {status.get('error')}")
-                        break
+            if result.size != original_size:
+                result = result.resize(original_size, Image.Resampling.LANCZOS)
 
-                return None
+            return result
 
         except ImportError:
             logger.error("未安装 httpx")
@@ -476,6 +1017,41 @@ class SDXLInpainter:
             logger.error(f"SDXL 错误: {e}")
             return None
 
+    async def _wait_prediction(self, client, prediction: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """等待预测完成（指数退避轮询），成功返回预测结果，失败或超时返回 None"""
+        poll_url = (prediction.get("urls") or {}).get("get") or f"{self.base_url}/predictions/{prediction['id']}"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.replicate_timeout
+        delay = self.POLL_INITIAL
+        status = prediction
+
+        while True:
+            state = status.get("status")
+            if state == "succeeded":
+                return status
+            if state in ("failed", "canceled"):
+                logger.error(f"SDXL 处理失败: {status.get('error')}")
+                return None
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.error(f"SDXL 处理超时: {prediction.get('id')}")
+                return None
+
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * self.POLL_BACKOFF, self.POLL_MAX)
+
+            self.poll_count += 1
+            status_response = await client.get(poll_url)
+            status = status_response.json()
+
+
+@lru_cache(maxsize=1)
+def _h2_available() -> bool:
+    """httpx 的 HTTP/2 支持依赖可选的 h2 包"""
+    import importlib.util
+    return importlib.util.find_spec("h2") is not None
+
 
 class WatermarkModel:
     """
@@ -489,24 +1065,82 @@ class WatermarkModel:
     """
 
     MODEL_URL = "https://huggingface.co/Carve/LaMa-ONNX/resolve/main/lama_fp32.onnx"
+    FALLBACK_MIN_PIXELS = 64 * 64  # 遮罩像素少于此值时 OpenCV 回退不降采样
 
-    def __init__(self):
+    def __init__(self, num_threads: int = 0):
+        self.num_threads = num_threads  # 推理线程数，0 表示默认
         self.lama = LaMaInpainter()
         self.sdxl = None
-        self.detector = WatermarkDetector()
+        self.variant: Optional[str] = None  # 实际加载的 LaMa 变体
+        self.detector = WatermarkDetector(num_threads, settings.watermark_ocr_concurrency)
         self.mode = settings.ai_mode
-        self._init()
+        self.state = ModelState.IDLE.value
+        self._load_lock = threading.Lock()
+        self._loaded = threading.Event()  # _init() 执行完毕（无论成功与否）后才置位
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded.is_set()
+
+    def load(self) -> None:
+        """加载模型（幂等，线程安全；其他线程正在加载时等待其完成）"""
+        with self._load_lock:
+            if self._loaded.is_set():
+                return
+            try:
+                self._init()
+            finally:
+                self._loaded.set()
+
+    async def ensure_loaded(self) -> None:
+        """
+        确保模型已加载（在线程池中执行）
+
+        预热或其他请求正在加载时等待加载完成，避免在 LaMa 就绪前误用 OpenCV 回退
+        """
+        if not self._loaded.is_set():
+            loop = asyncio.get_running_loop()
+            with stage("load"):
+                await loop.run_in_executor(None, self.load)
+
+    def warmup(self) -> None:
+        """预热：加载模型、构建 EasyOCR、执行一次 512x512 空推理"""
+        self.state = ModelState.WARMING.value
+        start = time.perf_counter()
+        try:
+            self.load()
+
+            if self.lama.loaded:
+                try:
+                    self.lama.warmup()
+                except Exception as e:
+                    logger.warning(f"LaMa 预热失败: {e}")
+
+            try:
+                self.detector.warmup()
+            except Exception as e:
+                logger.warning(f"EasyOCR 预热失败: {e}")
+        finally:
+            self.state = ModelState.READY.value
+
+        logger.info(f"模型预热完成，耗时 {time.perf_counter() - start:.1f}s")
 
     def _init(self):
         """初始化模型"""
         logger.info(f"模型初始化 (模式: {self.mode})")
 
         if self.mode == AIMode.LOCAL.value:
-            model_path = BASE_DIR / "models" / "lama_fp32.onnx"
+            selected = resolve_variant(
+                BASE_DIR / "models",
+                settings.watermark_model_variant,
+                self._load_runner,
+                settings.watermark_variant_min_psnr,
+            )
 
-            if model_path.exists():
-                self.lama.load(model_path)
-            else:
+            if selected:
+                self.variant, model_path = selected
+                self.lama.load(model_path, intra_op_threads=self.num_threads)
+            elif not available_variants(BASE_DIR / "models"):
                 logger.warning(
                     f"模型文件未找到，路径: backend/models/lama_fp32.onnx，"
                     f"下载地址: {self.MODEL_URL}"
@@ -519,31 +1153,135 @@ class WatermarkModel:
             else:
                 logger.warning("未设置 REPLICATE_API_TOKEN")
 
-    async def inpaint(self, image: Image.Image, mask: Image.Image) -> Optional[Image.Image]:
-        """执行图像修复"""
-        if self.mode == AIMode.CLOUD.value and self.sdxl:
-            result = await self.sdxl.inpaint(image, mask)
+    async def close(self) -> None:
+        """释放云端推理的连接池"""
+        if self.sdxl:
+            await self.sdxl.close()
+
+    @property
+    def inpaint_max_size(self) -> Optional[int]:
+        """推理前图片会被缩放到的最大边长（云端模式），本地推理返回 None"""
+        if self.mode == AIMode.CLOUD.value and settings.replicate_api_token:
+            return SDXLInpainter.MAX_SIZE
+        return None
+
+    def expand_region(self, x: int, y: int, w: int, h: int,
+                      img_w: int, img_h: int) -> Tuple[int, int, int, int]:
+        """本地推理实际读取的区域（遮罩 bbox 加边距并扩展到模型输入尺寸）"""
+        return self.lama._expand_bbox(x, y, w, h, img_w, img_h)
+
+    def is_single_window(self, w: int, h: int) -> bool:
+        """区域可由一次推理覆盖（多窗口时分块 / 连通域窗口按整图边界规划）"""
+        return w <= self.lama.input_size and h <= self.lama.input_size
+
+    def _load_runner(self, model_path: Path) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+        """加载独立的 LaMa 会话用于变体评估"""
+        lama = LaMaInpainter()
+        if not lama.load(model_path, intra_op_threads=self.num_threads):
+            raise RuntimeError(f"加载失败: {model_path.name}")
+        return lama._run_inference
+
+    async def inpaint(self, image: Image.Image, mask: Image.Image,
+                      use_cloud: bool = True) -> Optional[Image.Image]:
+        """执行图像修复（use_cloud=False 时跳过云端推理，直接使用本地方案）"""
+        await self.ensure_loaded()
+
+        if use_cloud:
+            result = await self.inpaint_cloud(image, mask)
             if result:
                 return result
 
         if self.lama.loaded:
             return await self.lama.inpaint(image, mask)
 
-        return await self._opencv_fallback(image, mask)
+        with stage("opencv"):
+            return await self._opencv_fallback(image, mask)
+
+    async def inpaint_cloud(self, image: Image.Image, mask: Image.Image) -> Optional[Image.Image]:
+        """云端推理（非云端模式或推理失败时返回 None）"""
+        await self.ensure_loaded()
+        if self.mode == AIMode.CLOUD.value and self.sdxl:
+            with stage("sdxl"):
+                return await self.sdxl.inpaint(image, mask)
+        return None
 
     async def _opencv_fallback(self, image: Image.Image, mask: Image.Image) -> Image.Image:
-        """OpenCV 回退方案"""
-        img_array = np.array(image.convert('RGB'))
-        mask_array = np.array(mask.convert('L'))
-        mask_binary = (mask_array > 127).astype(np.uint8) * 255
+        """OpenCV 回退方案（在线程池中执行）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._opencv_inpaint, image, mask)
 
-        img_bgr = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        result_bgr = cv2.inpaint(img_bgr, mask_binary, 3, cv2.INPAINT_TELEA)
-        result_rgb = cv2.cvtColor(result_bgr, cv2.COLOR_BGR2RGB)
+    def _opencv_inpaint(self, image: Image.Image, mask: Image.Image) -> Image.Image:
+        """
+        cv2.inpaint (TELEA) 只处理遮罩附近区域
+
+        - 分散的水印按区域分别裁剪、修复并贴回，不转换整图像素
+        - watermark_fallback_scale < 1 时在缩小的区域上修复，放大后羽化融合回原图；
+          TELEA 耗时与遮罩像素数成正比，缩小一半约快 4 倍
+        """
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if mask.mode != 'L':
+            mask = mask.convert('L')
+
+        bbox = mask.getbbox()
+        if bbox is None:
+            return image.copy()
+
+        radius = settings.watermark_fallback_radius
+        scale = settings.watermark_fallback_scale
+        # 边距：修复半径（按缩放折算到原图）+ 羽化宽度，保证区域内结果与整图修复一致
+        pad = math.ceil((radius + 2) / scale) + (self.lama.feather_size if scale < 1 else 0)
+        x0, y0 = max(0, bbox[0] - pad), max(0, bbox[1] - pad)
+        x1, y1 = min(image.width, bbox[2] + pad), min(image.height, bbox[3] + pad)
+
+        _, mask_binary = cv2.threshold(np.array(mask.crop((x0, y0, x1, y1))), 127, 255, cv2.THRESH_BINARY)
+
+        result = image.copy()
+        for rx0, ry0, rx1, ry1 in self._fallback_regions(mask_binary, pad):
+            mask_crop = mask_binary[ry0:ry1, rx0:rx1]
+            if not cv2.countNonZero(mask_crop):
+                continue
+            box = (x0 + rx0, y0 + ry0, x0 + rx1, y0 + ry1)
+            img_crop = np.array(image.crop(box))
+            self._inpaint_region(img_crop, mask_crop, radius, scale)
+            result.paste(Image.fromarray(img_crop), box[:2])
+        return result
 
-        return Image.fromarray(result_rgb)
+    @staticmethod
+    def _fallback_regions(mask: np.ndarray, pad: int) -> List[Tuple[int, int, int, int]]:
+        """相距超过 2 * pad 的遮罩互不影响，按膨胀后的连通域拆分为独立区域（x0, y0, x1, y1）"""
+        h, w = mask.shape
+        factor = 4
+        small = cv2.resize(mask, ((w + factor - 1) // factor, (h + factor - 1) // factor),
+                           interpolation=cv2.INTER_AREA)
+        size = 2 * math.ceil(pad / factor) + 1
+        dilated = cv2.dilate((small > 0).view(np.uint8), np.ones((size, size), np.uint8))
+        _, _, stats, _ = cv2.connectedComponentsWithStats(dilated, connectivity=8)
+        return [
+            (int(x) * factor, int(y) * factor, min(w, int(x + bw) * factor), min(h, int(y + bh) * factor))
+            for x, y, bw, bh, _ in stats[1:]
+        ]
+
+    def _inpaint_region(self, img_crop: np.ndarray, mask_crop: np.ndarray, radius: int, scale: float) -> None:
+        """修复单个区域（原地写回 img_crop）"""
+        if cv2.countNonZero(mask_crop) < self.FALLBACK_MIN_PIXELS:
+            scale = 1.0
+
+        if scale >= 1:
+            img_crop[:] = cv2.inpaint(img_crop, mask_crop, radius, cv2.INPAINT_TELEA)
+            return
+
+        crop_h, crop_w = mask_crop.shape
+        small_size = (max(1, round(crop_w * scale)), max(1, round(crop_h * scale)))
+        small_img = cv2.resize(img_crop, small_size, interpolation=cv2.INTER_AREA)
+        # 缩小后任一像素含遮罩即视为遮罩，放大后完整覆盖原遮罩
+        small_mask = cv2.resize(mask_crop, small_size, interpolation=cv2.INTER_AREA)
+        _, small_mask = cv2.threshold(small_mask, 0, 255, cv2.THRESH_BINARY)
+
+        filled = cv2.inpaint(small_img, small_mask, radius, cv2.INPAINT_TELEA)
+        fill = cv2.resize(filled, (crop_w, crop_h), interpolation=cv2.INTER_LINEAR)
+        self.lama.blender.blend(img_crop, fill, mask_crop, 0, 0)
 
     async def detect_watermark_regions(self, image: Image.Image) -> List[Dict[str, Any]]:
-        """检测水印区域（EasyOCR 文字检测）"""
-        img_array = np.array(image.convert('RGB'))
-        return self.detector.detect(img_array)
+        """检测水印区域（EasyOCR 文字检测，在检测线程池中执行）"""
+        return await self.detector.detect_async(image)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 """去水印工具 - 数据模型"""
 
+from datetime import datetime
 from typing import Optional, List, Any, Dict
 from pydantic import BaseModel, ConfigDict
 
@@ -8,6 +9,21 @@ from pydantic import BaseModel, ConfigDict
 class RemovalResult(BaseModel):
     """去水印结果"""
     image_base64: Optional[str] = None
+    format: Optional[str] = None  # 输出格式：png / webp / jpeg
+
+
+class JobStatusResponse(BaseModel):
+    """异步任务状态"""
+    job_id: str
+    status: str  # queued / running / done / failed
+    done: int = 0  # 已完成的推理窗口数
+    total: int = 0  # 推理窗口总数
+    error: Optional[str] = None
+    format: Optional[str] = None  # 结果格式（完成后）
+    stages: Dict[str, float] = {}  # 各阶段耗时（毫秒）
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
 
 class WatermarkRegion(BaseModel):
@@ -45,3 +61,9 @@ class ModelStatusResponse(BaseModel):
     mode: str
     lama_loaded: bool
     cloud_available: bool
+    variant: Optional[str] = None  # 已加载的 LaMa 变体：fp32 / fp16 / int8
+    backend: str = "inline"
+    state: str = "ready"  # idle / warming / ready / error
+    pending: Optional[int] = None  # process 后端进行中 + 排队中的请求数
+    ocr: Optional[Dict[str, Any]] = None  # EasyOCR 检测队列指标
+    cache: Optional[Dict[str, Any]] = None  # 结果缓存命中统计
@@ -2,74 +2,334 @@
 """水印去除 - 业务层"""
 
 import io
+import asyncio
+import hashlib
 import logging
-from typing import Optional, List, Dict, Any
+import math
+from typing import Optional, List, Dict, Any, Tuple
 import numpy as np
 from PIL import Image
 
-from .model import WatermarkModel
+from aimultibox.core.cache import get_cache
+from aimultibox.core.config import settings, BASE_DIR, WatermarkBackend
+from aimultibox.core.timing import stage
+from .cache import ResultCache, make_cache_key
+from .encoder import EncodeOptions, EncodedImage, OutputFormat, encode_image, resolve_format
+from .model import WatermarkModel, ModelState
+from .upload import open_image
+from .worker import ProcessPoolBackend
 
 logger = logging.getLogger(__name__)
 
+DETECT_CACHE_NAME = "watermark_detect"
+
+# 遮罩二值化查找表（> 127 视为水印）
+_MASK_THRESHOLD = [0] * 128 + [255] * 128
+
+# 感知哈希命中后的缩略图校验：边长、平均 / 最大像素差（0-255）
+PHASH_THUMB_SIZE = 64
+PHASH_MAX_MEAN_DIFF = 1.0
+PHASH_MAX_PIXEL_DIFF = 16
+
+
+def _content_key(image_bytes: bytes) -> str:
+    """图片内容哈希"""
+    return f"sha256:{hashlib.sha256(image_bytes).hexdigest()}"
+
+
+def _perceptual_key(image: Image.Image) -> str:
+    """
+    感知哈希（dHash 64 位）+ 尺寸
+    同一图片重新编码（如 PNG 转存、元数据变化）后仍能命中
+    """
+    small = image.convert("L").resize((9, 8), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return f"dhash:{image.width}x{image.height}:{bits.tobytes().hex()}"
+
+
+def _thumbnail(image: Image.Image) -> np.ndarray:
+    """感知哈希命中后用于确认的灰度缩略图"""
+    small = image.convert("L").resize((PHASH_THUMB_SIZE, PHASH_THUMB_SIZE), Image.Resampling.BOX)
+    return np.asarray(small, dtype=np.int16)
+
+
+def _same_thumbnail(a: np.ndarray, b: np.ndarray) -> bool:
+    """
+    重新编码只带来细微噪声；布局相同但内容不同的图片（如同一界面的两张截图）
+    会在局部出现明显差异，dHash 相同也不复用检测结果
+    """
+    diff = np.abs(a - b)
+    return float(diff.mean()) <= PHASH_MAX_MEAN_DIFF and int(diff.max()) <= PHASH_MAX_PIXEL_DIFF
+
 
 class WatermarkRemovalService:
-    """水印去除服务"""
+    """
+    水印去除服务
+
+    后端:
+        inline  - 在当前进程内推理
+        process - 分发到独立进程池（见 worker.py）
+    """
     
-    def __init__(self):
-        self.model = WatermarkModel()
+    def __init__(self, model: Optional[WatermarkModel] = None, use_cache: bool = True):
+        self.model: Optional[WatermarkModel] = None
+        self.pool: Optional[ProcessPoolBackend] = None
+        self.cache: Optional[ResultCache] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+
+        if use_cache and settings.watermark_cache_max_bytes > 0:
+            self.cache = ResultCache(
+                max_bytes=settings.watermark_cache_max_bytes,
+                disk_dir=BASE_DIR / "data" / "watermark_cache" if settings.watermark_cache_disk else None,
+                disk_max_bytes=settings.watermark_cache_disk_max_bytes,
+            )
+
+        if model is not None:
+            self.model = model
+        elif settings.watermark_backend == WatermarkBackend.PROCESS.value:
+            self.pool = ProcessPoolBackend(
+                workers=settings.watermark_workers,
+                num_threads=settings.watermark_worker_threads,
+                queue_depth=settings.watermark_queue_depth,
+            )
+        else:
+            self.model = WatermarkModel()
+
+    @property
+    def backend(self) -> str:
+        return WatermarkBackend.PROCESS.value if self.pool else WatermarkBackend.INLINE.value
+
+    @property
+    def state(self) -> str:
+        """模型状态（见 ModelState）"""
+        return self.pool.state if self.pool else self.model.state
+
+    @property
+    def is_warming(self) -> bool:
+        return self.state == ModelState.WARMING.value
+
+    async def startup(self) -> None:
+        """应用启动时调用：后台预热模型，不阻塞启动"""
+        if settings.watermark_warmup:
+            self._warmup_task = asyncio.create_task(self.warmup())
+
+    async def warmup(self) -> None:
+        """预热模型"""
+        if self.pool:
+            await self.pool.start()
+            return
+
+        self.model.state = ModelState.WARMING.value
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.model.warmup)
+        except Exception as e:
+            logger.error(f"模型预热失败: {e}")
+            self.model.state = ModelState.READY.value
+
+    async def shutdown(self) -> None:
+        """应用停止时调用"""
+        if self._warmup_task and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        if self.pool:
+            self.pool.shutdown()
+        elif self.model:
+            await self.model.close()
     
     async def remove_watermark(
         self,
         image_bytes: bytes,
         mask_bytes: Optional[bytes] = None,
-    ) -> Optional[bytes]:
+        regions: Optional[List[Dict[str, Any]]] = None,
+        encode: Optional[EncodeOptions] = None,
+    ) -> Optional[EncodedImage]:
         """
         去除水印
         
         Args:
             image_bytes: 原始图片字节
             mask_bytes: 遮罩图片字节（可选，为空则自动检测）
+            regions: 已知的水印区域（可选，自动模式下跳过检测）
+            encode: 输出编码参数（为空使用配置默认格式）
         
         Returns:
-            处理后的图片字节，失败返回 None
+            编码后的结果图片，失败返回 None
+
+        Raises:
+            WorkerQueueFullError: process 后端排队已满
         """
+        encode = self._resolve_encode(image_bytes, encode)
+        # 预热期间可能得到 OpenCV 回退结果，不写入缓存（避免之后的请求一直命中降级结果）
+        warming = self.is_warming
+
+        cache_key = None
+        if self.cache:
+            mode = f"{settings.ai_mode}:{'manual' if mask_bytes else 'auto'}"
+            cache_key = make_cache_key(image_bytes, mask_bytes, mode, encode.format, str(encode.quality))
+            with stage("cache"):
+                cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return EncodedImage(data=cached, format=encode.format, encode_ms=0.0)
+
+        if self.pool:
+            if regions is None and not mask_bytes:
+                # 复用 API 进程中已有的检测结果，worker 可跳过 OCR
+                regions = self._get_cached_regions([_content_key(image_bytes)])
+            with stage("worker"):
+                result = await self.pool.remove_watermark(image_bytes, mask_bytes, regions, encode)
+        else:
+            result = await self._remove_watermark(image_bytes, mask_bytes, regions, encode)
+
+        if result is not None:
+            logger.debug(f"输出编码: {result.format} {result.size} bytes, {result.encode_ms:.1f}ms")
+            if cache_key and not (warming or self.is_warming):
+                await self.cache.set(cache_key, result.data)
+        return result
+
+    def _resolve_encode(self, image_bytes: bytes, encode: Optional[EncodeOptions]) -> EncodeOptions:
+        """确定输出格式（auto 时仅读取图片头识别输入格式）"""
+        encode = encode or EncodeOptions(format=settings.watermark_output_format)
+        if encode.format != OutputFormat.AUTO.value:
+            return encode
+
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-            if image.mode != "RGB":
-                image = image.convert("RGB")
+            source_format = Image.open(io.BytesIO(image_bytes)).format
+        except Exception:
+            source_format = None
+        return EncodeOptions(format=resolve_format(encode.format, source_format), quality=encode.quality)
+
+    async def _remove_watermark(self, image_bytes: bytes, mask_bytes: Optional[bytes],
+                                regions: Optional[List[Dict[str, Any]]] = None,
+                                encode: Optional[EncodeOptions] = None) -> Optional[EncodedImage]:
+        """进程内去除水印"""
+        try:
+            # 手动遮罩 + 云端推理时图片本就会缩小，JPEG 直接降采样解码（云端失败时见 _inpaint_drafted）
+            draft_size = None
+            max_size = self.model.inpaint_max_size
+            if mask_bytes and max_size and settings.watermark_jpeg_draft:
+                draft_size = (max_size, max_size)
+
+            with stage("decode"):
+                image = open_image(image_bytes, draft_size)
+                image.load()
+                original_size = Image.open(io.BytesIO(image_bytes)).size if draft_size else image.size
             
             if mask_bytes:
-                mask = Image.open(io.BytesIO(mask_bytes))
-                if mask.mode != "L":
-                    mask = mask.convert("L")
-                if mask.size != image.size:
-                    mask = mask.resize(image.size, Image.Resampling.NEAREST)
+                with stage("mask"):
+                    mask = self._open_mask(mask_bytes)
+                    # 本地推理只处理遮罩附近区域（云端模式整图送入 SDXL）
+                    roi = None if max_size else self._mask_roi(mask, image.size)
+                if roi is not None:
+                    result = await self._inpaint_roi(image, mask, roi)
+                elif image.size != original_size:
+                    result = await self._inpaint_drafted(image, mask, image_bytes)
+                else:
+                    if mask.size != image.size:
+                        with stage("mask"):
+                            mask = mask.resize(image.size, Image.Resampling.NEAREST)
+                    result = await self.model.inpaint(image, mask)
             else:
-                mask = await self._auto_generate_mask(image)
-            
-            mask_array = np.array(mask)
-            if np.sum(mask_array > 127) < 100:
-                pass  # 遮罩区域过小，但仍尝试处理
-            
-            result = await self.model.inpaint(image, mask)
+                if regions is None:
+                    regions = await self._detect_regions(image, image_bytes)
+                with stage("mask"):
+                    mask = self._auto_generate_mask(image, regions)
+                result = await self.model.inpaint(image, mask)
             
             if result is None:
                 return None
+
+            if result.size != original_size:
+                with stage("resize"):
+                    result = result.resize(original_size, Image.Resampling.LANCZOS)
             
-            output = io.BytesIO()
-            result.save(output, format="PNG", quality=95)
-            return output.getvalue()
+            loop = asyncio.get_running_loop()
+            with stage("encode"):
+                return await loop.run_in_executor(
+                    None, encode_image, result, encode or EncodeOptions(format=settings.watermark_output_format)
+                )
             
         except Exception:
+            logger.exception("去除水印失败")
             return None
     
-    async def _auto_generate_mask(self, image: Image.Image) -> Image.Image:
-        """自动生成遮罩"""
+    @staticmethod
+    def _open_mask(mask_bytes: bytes) -> Image.Image:
+        mask = Image.open(io.BytesIO(mask_bytes))
+        if mask.mode != "L":
+            mask = mask.convert("L")
+        return mask
+
+    async def _inpaint_drafted(self, image: Image.Image, mask: Image.Image,
+                               image_bytes: bytes) -> Optional[Image.Image]:
+        """
+        降采样解码的图片：仅用于云端推理（SDXL 本就按缩小后的尺寸生成）
+
+        云端推理失败时，本地回退的结果会放大回原图尺寸，整图都会变糊；
+        此时按原分辨率重新解码后再走本地方案
+        """
+        with stage("mask"):
+            small_mask = mask.resize(image.size, Image.Resampling.NEAREST)
+        result = await self.model.inpaint_cloud(image, small_mask)
+        if result is not None:
+            return result
+
+        with stage("decode"):
+            image = open_image(image_bytes)
+            image.load()
+        if mask.size != image.size:
+            with stage("mask"):
+                mask = mask.resize(image.size, Image.Resampling.NEAREST)
+        return await self.model.inpaint(image, mask, use_cloud=False)
+
+    def _mask_roi(self, mask: Image.Image, image_size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
+        """
+        在原始遮罩上计算 bbox，映射到图片坐标并扩展为推理区域
+
+        遮罩为空，或推理区域需要多个窗口时返回 None（走整图路径）：
+        多窗口的规划以图片边界为准，在裁剪区域内规划会改变窗口位置，输出与整图路径不一致
+        """
+        bbox = mask.point(_MASK_THRESHOLD).getbbox()
+        if bbox is None:
+            return None
+
+        img_w, img_h = image_size
+        scale_x = img_w / mask.width
+        scale_y = img_h / mask.height
+        left = max(0, math.floor(bbox[0] * scale_x))
+        top = max(0, math.floor(bbox[1] * scale_y))
+        right = min(img_w, math.ceil(bbox[2] * scale_x))
+        bottom = min(img_h, math.ceil(bbox[3] * scale_y))
+        region = self.model.expand_region(left, top, right - left, bottom - top, img_w, img_h)
+        _, _, w, h = region
+        return region if self.model.is_single_window(w, h) else None
+
+    async def _inpaint_roi(self, image: Image.Image, mask: Image.Image,
+                           roi: Tuple[int, int, int, int]) -> Optional[Image.Image]:
+        """只裁剪、修复推理区域，再贴回原图（遮罩只缩放对应区域）"""
+        x, y, w, h = roi
+        if mask.size == image.size:
+            mask_crop = mask.crop((x, y, x + w, y + h))
+        else:
+            # 与整张遮罩缩放后再裁剪的采样位置一致
+            scale_x = mask.width / image.width
+            scale_y = mask.height / image.height
+            box = (x * scale_x, y * scale_y, (x + w) * scale_x, (y + h) * scale_y)
+            with stage("mask"):
+                mask_crop = mask.resize((w, h), Image.Resampling.NEAREST, box=box)
+
+        result = await self.model.inpaint(image.crop((x, y, x + w, y + h)), mask_crop)
+        if result is None:
+            return None
+
+        image.paste(result, (x, y))
+        return image
+
+    def _auto_generate_mask(self, image: Image.Image, regions: List[Dict[str, Any]]) -> Image.Image:
+        """根据检测区域自动生成遮罩"""
         width, height = image.size
         mask = Image.new("L", (width, height), 0)
         
-        regions = await self.model.detect_watermark_regions(image)
-        
         logger.debug(f"检测到 {len(regions)} 个文字区域")
         for r in regions:
             logger.debug(f"  - '{r.get('text', '')}' conf={r.get('confidence', 0):.2f} pos=({r['x']},{r['y']}) size={r['width']}x{r['height']}")
@@ -98,20 +358,110 @@ class WatermarkRemovalService:
     
     async def detect_watermark(self, image_bytes: bytes) -> List[Dict[str, Any]]:
         """检测水印区域"""
+        if self.pool:
+            # worker 检测失败时抛出异常，不会缓存空结果
+            keys = [_content_key(image_bytes)]
+            regions = self._get_cached_regions(keys)
+            if regions is None:
+                with stage("worker"):
+                    regions = await self.pool.detect_watermark(image_bytes)
+                self._set_cached_regions(keys, regions)
+            return regions
+
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-            
-            return await self.model.detect_watermark_regions(image)
-            
+            return await self.detect_watermark_or_raise(image_bytes)
         except Exception:
+            logger.exception("水印检测失败")
             return []
+
+    async def detect_watermark_or_raise(self, image_bytes: bytes) -> List[Dict[str, Any]]:
+        """进程内检测水印区域，失败时抛出异常（供 worker 调用）"""
+        with stage("decode"):
+            image = open_image(image_bytes)
+        return await self._detect_regions(image, image_bytes)
+
+    async def _detect_regions(self, image: Image.Image, image_bytes: bytes) -> List[Dict[str, Any]]:
+        """
+        检测水印区域（带缓存）
+        /detect 与 /remove-auto 共用，同一图片只执行一次 OCR；
+        启用感知哈希时，重新编码的同一图片经缩略图校验后复用检测结果
+        """
+        keys = [_content_key(image_bytes)]
+        regions = self._get_cached_regions(keys)
+
+        phash_key = thumbnail = None
+        if regions is None and settings.watermark_detect_phash:
+            phash_key, thumbnail = _perceptual_key(image), _thumbnail(image)
+            regions = self._get_phash_regions(phash_key, thumbnail)
+
+        if regions is None:
+            with stage("detect"):
+                regions = await self.model.detect_watermark_regions(image)
+            self._set_cached_regions(keys, regions)
+            if phash_key:
+                self._set_phash_regions(phash_key, thumbnail, regions)
+        return regions
+
+    def _detect_cache(self):
+        return get_cache(DETECT_CACHE_NAME, settings.watermark_detect_cache_size, settings.watermark_detect_cache_ttl)
+
+    def _get_cached_regions(self, keys: List[str]) -> Optional[List[Dict[str, Any]]]:
+        if settings.watermark_detect_cache_size <= 0:
+            return None
+        cache = self._detect_cache()
+        for key in keys:
+            regions = cache.get(key)
+            if regions is not None:
+                logger.debug(f"检测缓存命中: {key[:24]}")
+                return list(regions)
+        return None
+
+    def _get_phash_regions(self, key: str, thumbnail: np.ndarray) -> Optional[List[Dict[str, Any]]]:
+        """感知哈希命中且缩略图一致时返回缓存的检测结果"""
+        if settings.watermark_detect_cache_size <= 0:
+            return None
+        entry = self._detect_cache().get(key)
+        if entry is None:
+            return None
+        cached_thumbnail, regions = entry
+        if not _same_thumbnail(cached_thumbnail, thumbnail):
+            logger.debug(f"感知哈希命中但缩略图不一致: {key[:24]}")
+            return None
+        logger.debug(f"检测缓存命中: {key[:24]}")
+        return list(regions)
+
+    def _set_cached_regions(self, keys: List[str], regions: List[Dict[str, Any]]) -> None:
+        if settings.watermark_detect_cache_size <= 0:
+            return
+        cache = self._detect_cache()
+        for key in keys:
+            cache[key] = list(regions)
+
+    def _set_phash_regions(self, key: str, thumbnail: np.ndarray, regions: List[Dict[str, Any]]) -> None:
+        if settings.watermark_detect_cache_size <= 0:
+            return
+        self._detect_cache()[key] = (thumbnail, list(regions))
     
     def get_model_status(self) -> Dict[str, Any]:
         """获取模型状态"""
-        return {
-            "mode": self.model.mode,
-            "lama_loaded": self.model.lama.loaded,
-            "cloud_available": self.model.sdxl is not None,
-        }
+        if self.pool:
+            status = {
+                "mode": settings.ai_mode,
+                "lama_loaded": False,
+                "cloud_available": False,
+                **self.pool.get_model_status(),
+                "pending": self.pool.pending,
+            }
+        else:
+            status = {
+                "mode": self.model.mode,
+                "lama_loaded": self.model.lama.loaded,
+                "variant": self.model.variant,
+                "cloud_available": self.model.sdxl is not None,
+                "ocr": self.model.detector.get_stats(),
+            }
+        status["backend"] = self.backend
+        status["state"] = self.state
+        if self.cache:
+            status["cache"] = self.cache.get_stats()
+        return status
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+水印去除 - 上传读取与图片解码
+
+- 分块读取上传文件，超过 max_upload_size 时拒绝
+  （表单在进入路由前已被完整接收，整体请求体大小由 BodySizeLimitMiddleware 在解析前限制）
+- 解码前仅读取图片头获取尺寸，拒绝超大 / 解压炸弹图片
+- 对之后本就会缩小处理的 JPEG，使用 draft 在解码阶段直接降采样
+"""
+
+import io
+import warnings
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from fastapi import UploadFile
+from PIL import Image
+from starlette import status as HTTP
+
+from aimultibox.core.config import settings
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class UploadRejectedError(Exception):
+    """上传被拒绝（携带 HTTP 状态码）"""
+
+    def __init__(self, message: str, status_code: int = HTTP.HTTP_400_BAD_REQUEST):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(message)
+
+
+@dataclass
+class ImageProbe:
+    """图片头信息"""
+    format: Optional[str]
+    width: int
+    height: int
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+
+async def read_upload(file: UploadFile, max_bytes: Optional[int] = None) -> bytes:
+    """分块读取上传文件，超出单文件上限时拒绝"""
+    max_bytes = max_bytes or settings.max_upload_size
+    if file.size is not None and file.size > max_bytes:
+        raise UploadRejectedError(_too_large_message(max_bytes), HTTP.HTTP_413_CONTENT_TOO_LARGE)
+
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if len(buffer) + len(chunk) > max_bytes:
+            raise UploadRejectedError(_too_large_message(max_bytes), HTTP.HTTP_413_CONTENT_TOO_LARGE)
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def probe_image(data: bytes, max_pixels: Optional[int] = None) -> ImageProbe:
+    """只解析图片头，校验格式与像素数（不解码像素数据）"""
+    max_pixels = max_pixels or settings.watermark_max_image_pixels
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            image = Image.open(io.BytesIO(data))
+            probe = ImageProbe(format=image.format, width=image.width, height=image.height)
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise UploadRejectedError("图片尺寸过大", HTTP.HTTP_413_CONTENT_TOO_LARGE)
+    except Exception:
+        raise UploadRejectedError("无法识别的图片格式")
+
+    if probe.pixels > max_pixels:
+        raise UploadRejectedError(
+            f"图片尺寸过大（{probe.width}x{probe.height}），最大 {max_pixels // 1_000_000}MP",
+            HTTP.HTTP_413_CONTENT_TOO_LARGE,
+        )
+    return probe
+
+
+def open_image(data: bytes, draft_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """
+    解码图片为 RGB
+
+    draft_size: 处理时会缩小到该尺寸以内时传入，JPEG 直接按 1/2、1/4、1/8 降采样解码
+    """
+    image = Image.open(io.BytesIO(data))
+    if draft_size and image.format == "JPEG":
+        image.draft("RGB", draft_size)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def _too_large_message(max_bytes: int) -> str:
+    return f"文件过大，最大 {max_bytes // (1024 * 1024)}MB"
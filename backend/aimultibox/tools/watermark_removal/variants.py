@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+水印去除 - LaMa 模型变体选择
+
+变体文件（backend/models/ 下，int8 / fp16 由 scripts/quantize_lama.py 生成）：
+- fp32 : lama_fp32.onnx（原始模型）
+- fp16 : lama_fp16.onnx
+- int8 : lama_int8.onnx（动态量化）
+
+选择策略（watermark_model_variant）：
+- fp32 / fp16 / int8 : 指定变体，文件不存在时回退 fp32
+- auto : 以 fp32 输出为基准，选择 PSNR 达标的最快变体；结果按文件信息缓存，重启时不重复评估。
+  没有可用的 fp32 基准时不接受其他变体（缺少 fp32 文件时使用 OpenCV 回退，fp32 评估失败时使用 fp32）
+"""
+
+import json
+import logging
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Optional, Dict, Callable, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 推理函数：(image NCHW, mask N1HW) -> output NCHW
+Runner = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+BENCH_RUNS = 3  # 每个变体计时次数（取最小值）
+DECISION_FILE = "lama_variant.json"
+
+
+class ModelVariant(str, Enum):
+    """LaMa 模型变体"""
+    FP32 = "fp32"
+    FP16 = "fp16"
+    INT8 = "int8"
+    AUTO = "auto"  # 自动选择
+
+
+VARIANT_FILES = {
+    ModelVariant.FP32.value: "lama_fp32.onnx",
+    ModelVariant.FP16.value: "lama_fp16.onnx",
+    ModelVariant.INT8.value: "lama_int8.onnx",
+}
+
+
+def available_variants(model_dir: Path) -> Dict[str, Path]:
+    """已存在的变体文件"""
+    found = {}
+    for name, filename in VARIANT_FILES.items():
+        path = model_dir / filename
+        if path.exists():
+            found[name] = path
+    return found
+
+
+def probe_inputs(size: int = 512) -> Tuple[np.ndarray, np.ndarray]:
+    """固定的评估输入：渐变 + 色块 + 噪声背景，中间矩形遮罩"""
+    rng = np.random.default_rng(0)
+    ys, xs = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    image = np.stack([ys, xs, (ys + xs) / 2], axis=0)
+    image[:, size // 8:size // 3, size // 2:size - size // 8] = [[[0.8]], [[0.3]], [[0.1]]]
+    image += rng.normal(0, 0.02, image.shape).astype(np.float32)
+    image = np.clip(image, 0, 1)[np.newaxis]
+
+    mask = np.zeros((1, 1, size, size), dtype=np.float32)
+    mask[..., size * 3 // 8:size * 5 // 8, size // 4:size * 3 // 4] = 1.0
+    return image, mask
+
+
+def masked_psnr(output: np.ndarray, reference: np.ndarray, mask: np.ndarray) -> float:
+    """遮罩区域内的 PSNR（按输出的 uint8 结果计算）"""
+    out = np.clip(output.astype(np.float32), 0, 255).round()
+    ref = np.clip(reference.astype(np.float32), 0, 255).round()
+    region = np.broadcast_to(mask > 0.5, out.shape)
+    mse = float(np.mean((out[region] - ref[region]) ** 2))
+    if mse == 0:
+        return float("inf")
+    return 10 * np.log10(255.0 ** 2 / mse)
+
+
+def resolve_variant(model_dir: Path, policy: str, load: Callable[[Path], Runner],
+                    min_psnr: float) -> Optional[Tuple[str, Path]]:
+    """
+    按策略确定要加载的变体
+
+    Args:
+        model_dir: 模型目录
+        policy: 变体名或 auto
+        load: 加载指定文件并返回推理函数（仅 auto 评估时调用）
+        min_psnr: auto 模式下变体相对 fp32 的最低 PSNR（dB）
+
+    Returns:
+        (变体名, 文件路径)，没有可用模型（或 auto 缺少 fp32 基准）时返回 None
+    """
+    found = available_variants(model_dir)
+    if not found:
+        return None
+
+    if policy != ModelVariant.AUTO.value:
+        if policy in found:
+            return policy, found[policy]
+        fallback = ModelVariant.FP32.value if ModelVariant.FP32.value in found else next(iter(found))
+        logger.warning(f"模型变体 {policy} 不存在，使用 {fallback}")
+        return fallback, found[fallback]
+
+    fp32 = ModelVariant.FP32.value
+    if fp32 not in found:
+        # 没有基准无法做质量校验，不自动启用未经校验的变体
+        logger.warning(
+            f"缺少 fp32 基准模型，无法校验 {', '.join(found)} 的质量，使用 OpenCV 回退；"
+            f"如需直接使用请设置 WATERMARK_MODEL_VARIANT"
+        )
+        return None
+
+    if len(found) == 1:
+        return fp32, found[fp32]
+
+    fingerprint = _fingerprint(found, min_psnr)
+    cached = _load_decision(model_dir, fingerprint)
+    if cached in found:
+        logger.info(f"模型变体: {cached}（已缓存的评估结果）")
+        return cached, found[cached]
+
+    name = _evaluate(found, load, min_psnr)
+    if name is None:
+        # fp32 基准评估失败：不缓存结果，下次启动重新评估
+        return fp32, found[fp32]
+    _save_decision(model_dir, fingerprint, name)
+    return name, found[name]
+
+
+def _benchmark(path: Path, load: Callable[[Path], Runner],
+               image: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, float]:
+    """加载并计时单个变体，返回 (输出, 最短耗时秒)"""
+    run = load(path)
+    output = run(image, mask)  # 预热
+    elapsed = []
+    for _ in range(BENCH_RUNS):
+        start = time.perf_counter()
+        output = run(image, mask)
+        elapsed.append(time.perf_counter() - start)
+    return output, min(elapsed)
+
+
+def _evaluate(found: Dict[str, Path], load: Callable[[Path], Runner], min_psnr: float) -> Optional[str]:
+    """
+    计时各变体并与 fp32 输出比较
+
+    Returns:
+        选中的变体名；fp32 基准评估失败时返回 None（不接受任何未经校验的变体）
+    """
+    image, mask = probe_inputs()
+    fp32 = ModelVariant.FP32.value
+    try:
+        reference, latency = _benchmark(found[fp32], load, image, mask)
+    except Exception as e:
+        logger.warning(f"fp32 基准模型评估失败，不启用其他变体: {e}")
+        return None
+
+    results: Dict[str, Tuple[float, float]] = {fp32: (latency, float("inf"))}
+    logger.info(f"模型变体 {fp32}: {latency * 1000:.0f}ms（基准）")
+
+    for name in VARIANT_FILES:
+        if name == fp32 or name not in found:
+            continue
+        try:
+            output, latency = _benchmark(found[name], load, image, mask)
+        except Exception as e:
+            logger.warning(f"模型变体 {name} 评估失败: {e}")
+            continue
+
+        psnr = masked_psnr(output, reference, mask)
+        results[name] = (latency, psnr)
+        logger.info(f"模型变体 {name}: {latency * 1000:.0f}ms, PSNR {psnr:.1f}dB")
+
+    passed = {name: latency for name, (latency, psnr) in results.items() if psnr >= min_psnr}
+    name = min(passed, key=passed.get)
+    logger.info(f"模型变体: {name}（最低 PSNR {min_psnr}dB）")
+    return name
+
+
+def _fingerprint(found: Dict[str, Path], min_psnr: float) -> Dict[str, object]:
+    """评估结果的有效条件：模型文件、阈值与 onnxruntime 版本不变"""
+    try:
+        import onnxruntime as ort
+        ort_version = ort.__version__
+    except ImportError:
+        ort_version = ""
+
+    files = {}
+    for name, path in found.items():
+        stat = path.stat()
+        files[name] = [stat.st_size, stat.st_mtime_ns]
+    return {"files": files, "min_psnr": min_psnr, "onnxruntime": ort_version}
+
+
+def _load_decision(model_dir: Path, fingerprint: Dict[str, object]) -> Optional[str]:
+    try:
+        data = json.loads((model_dir / DECISION_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if data.get("fingerprint") != fingerprint:
+        return None
+    return data.get("variant")
+
+
+def _save_decision(model_dir: Path, fingerprint: Dict[str, object], name: str) -> None:
+    try:
+        (model_dir / DECISION_FILE).write_text(
+            json.dumps({"variant": name, "fingerprint": fingerprint}, indent=2),
+            encoding="utf-8",
+        )
+    except OSError as e:
+        logger.warning(f"保存模型变体评估结果失败: {e}")
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+水印去除 - 进程池推理后端
+
+每个 worker 进程持有独立的 WatermarkModel，图片字节通过共享内存传递，
+API 进程只负责调度，推理负载不影响其他接口的响应
+
+推理进度（inpaint_progress）经进程间队列回传，由 API 进程的监听线程转交给提交方的事件循环
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+from typing import Optional, List, Dict, Any, Callable, Tuple, Awaitable
+
+from aimultibox.core.timing import StageTimer, current_timer
+from .encoder import EncodeOptions, EncodedImage
+from .model import ModelState, inpaint_progress
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerQueueFullError(RuntimeError):
+    """进程池排队已满"""
+
+
+WORKER_START_TIMEOUT = 600  # 启动时等待全部 worker 完成预热的最长时间（秒）
+
+
+# ==================== worker 进程侧 ====================
+
+_service = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_progress_queue = None
+_start_barrier = None
+
+
+def _init_worker(num_threads: int, progress_queue=None, start_barrier=None) -> None:
+    """worker 初始化：限制线程数并加载模型"""
+    global _service, _loop, _progress_queue, _start_barrier
+    _progress_queue = progress_queue
+    _start_barrier = start_barrier
+
+    import cv2
+    if num_threads > 0:
+        cv2.setNumThreads(num_threads)
+
+    from .model import WatermarkModel
+    from .service import WatermarkRemovalService
+
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    model = WatermarkModel(num_threads=num_threads)
+    model.warmup()
+    _service = WatermarkRemovalService(model=model, use_cache=False)
+
+
+def _read_shared(name: str, sizes: Tuple[int, ...]) -> List[bytes]:
+    """从共享内存读取连续存放的多段字节"""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        chunks = []
+        offset = 0
+        for size in sizes:
+            chunks.append(bytes(shm.buf[offset:offset + size]))
+            offset += size
+        return chunks
+    finally:
+        shm.close()
+
+
+def _run_timed(coro: Awaitable[Any], progress_id: Optional[int] = None) -> Tuple[Any, Dict[str, float]]:
+    """在 worker 事件循环中执行，连同各阶段耗时一起返回；progress_id 非空时回传推理进度"""
+    timer = StageTimer()
+    token = timer.activate()
+    progress_token = None
+    if progress_id is not None and _progress_queue is not None:
+        progress_token = inpaint_progress.set(
+            lambda done, total: _progress_queue.put((progress_id, done, total))
+        )
+    try:
+        return _loop.run_until_complete(coro), timer.stages
+    finally:
+        if progress_token is not None:
+            inpaint_progress.reset(progress_token)
+        timer.deactivate(token)
+
+
+def _remove_in_worker(name: str, image_size: int, mask_size: int,
+                      regions: Optional[List[Dict[str, Any]]] = None,
+                      encode: Optional[EncodeOptions] = None,
+                      progress_id: Optional[int] = None) -> Tuple[Optional[EncodedImage], Dict[str, float]]:
+    image_bytes, mask_bytes = _read_shared(name, (image_size, mask_size))
+    return _run_timed(_service.remove_watermark(image_bytes, mask_bytes or None, regions, encode), progress_id)
+
+
+def _detect_in_worker(name: str, image_size: int) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+    image_bytes, = _read_shared(name, (image_size,))
+    return _run_timed(_service.detect_watermark_or_raise(image_bytes))
+
+
+def _status_in_worker() -> Dict[str, Any]:
+    # 启动时各 worker 在屏障处互相等待，已完成的 worker 不会领走其他 worker 的状态任务
+    if _start_barrier is not None:
+        _start_barrier.wait(timeout=WORKER_START_TIMEOUT)
+    return _service.get_model_status()
+
+
+# ==================== API 进程侧 ====================
+
+class ProcessPoolBackend:
+    """
+    进程池推理后端
+
+    - worker 数、每个 worker 的推理线程数、排队深度均可配置
+    - 超出排队深度直接拒绝（WorkerQueueFullError），避免请求无限堆积
+    - worker 异常退出时自动重建进程池
+    """
+
+    def __init__(self, workers: int = 2, num_threads: int = 2, queue_depth: int = 8):
+        self.workers = max(1, workers)
+        self.num_threads = num_threads
+        self.queue_depth = max(0, queue_depth)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._status: Dict[str, Any] = {}
+        self.state = ModelState.IDLE.value
+
+        # 推理进度回传：进度 ID -> (提交方事件循环, 回调)
+        self._progress_queue = None
+        self._progress_thread: Optional[threading.Thread] = None
+        self._progress_ids = itertools.count()
+        self._progress_callbacks: Dict[int, Tuple[asyncio.AbstractEventLoop, Callable[[int, int], None]]] = {}
+
+    @property
+    def pending(self) -> int:
+        """进行中 + 排队中的请求数"""
+        return self._pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn 避免 fork 继承 API 进程的线程与推理会话状态
+            context = get_context("spawn")
+            if self._progress_queue is None:
+                self._progress_queue = context.Queue()
+                self._progress_thread = threading.Thread(
+                    target=self._dispatch_progress, name="watermark-progress", daemon=True
+                )
+                self._progress_thread.start()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.num_threads, self._progress_queue, context.Barrier(self.workers)),
+            )
+            logger.info(f"去水印进程池已启动 (workers: {self.workers}, threads: {self.num_threads})")
+        return self._executor
+
+    async def _submit(self, func: Callable, *args) -> Any:
+        """提交任务到进程池（超出排队深度时拒绝）"""
+        if self._pending >= self.workers + self.queue_depth:
+            raise WorkerQueueFullError("去水印队列已满")
+
+        self._pending += 1
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                result = await loop.run_in_executor(self._get_executor(), func, *args)
+            except BrokenProcessPool:
+                logger.warning("去水印进程池异常，正在重建")
+                self._executor = None
+                result = await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._pending -= 1
+
+        if self.state == ModelState.ERROR.value:
+            self.state = ModelState.READY.value
+        return result
+
+    async def _submit_shared(self, func: Callable, chunks: Tuple[bytes, ...], *extra) -> Any:
+        """将字节写入共享内存后提交任务，完成后释放"""
+        total = sum(len(c) for c in chunks)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, total))
+        try:
+            offset = 0
+            for chunk in chunks:
+                shm.buf[offset:offset + len(chunk)] = chunk
+                offset += len(chunk)
+            return await self._submit(func, shm.name, *(len(c) for c in chunks), *extra)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def start(self) -> None:
+        """
+        启动进程池，等待各 worker 完成预热并获取模型状态
+
+        每个 worker 恰好执行一个状态任务（见 _status_in_worker）；
+        全部 worker 上报后才置为 READY，否则置为 ERROR
+        """
+        self.state = ModelState.WARMING.value
+        results = await asyncio.gather(
+            *[self._submit(_status_in_worker) for _ in range(self.workers)],
+            return_exceptions=True,
+        )
+        reported = 0
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"去水印 worker 启动失败: {result!r}")
+            else:
+                self._status = result
+                reported += 1
+
+        if reported == self.workers:
+            self.state = ModelState.READY.value
+        else:
+            logger.error(f"去水印 worker 预热未完成（{reported}/{self.workers}）")
+            self.state = ModelState.ERROR.value
+
+    def shutdown(self) -> None:
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._progress_queue is not None:
+            self._progress_queue.put(None)
+            self._progress_queue = None
+            self._progress_thread = None
+
+    def _dispatch_progress(self) -> None:
+        """监听线程：将 worker 回传的进度转交给提交方的事件循环"""
+        queue = self._progress_queue
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            progress_id, done, total = item
+            entry = self._progress_callbacks.get(progress_id)
+            if entry is not None:
+                loop, callback = entry
+                loop.call_soon_threadsafe(callback, done, total)
+
+    async def remove_watermark(self, image_bytes: bytes, mask_bytes: Optional[bytes] = None,
+                               regions: Optional[List[Dict[str, Any]]] = None,
+                               encode: Optional[EncodeOptions] = None) -> Optional[EncodedImage]:
+        progress = inpaint_progress.get()
+        progress_id = None
+        if progress is not None:
+            progress_id = next(self._progress_ids)
+            self._progress_callbacks[progress_id] = (asyncio.get_running_loop(), progress)
+        try:
+            result, stages = await self._submit_shared(
+                _remove_in_worker, (image_bytes, mask_bytes or b""), regions, encode, progress_id
+            )
+        finally:
+            if progress_id is not None:
+                self._progress_callbacks.pop(progress_id, None)
+        self._merge_stages(stages)
+        return result
+
+    async def detect_watermark(self, image_bytes: bytes) -> List[Dict[str, Any]]:
+        regions, stages = await self._submit_shared(_detect_in_worker, (image_bytes,))
+        self._merge_stages(stages)
+        return regions
+
+    @staticmethod
+    def _merge_stages(stages: Dict[str, float]) -> None:
+        """worker 内的阶段耗时计入当前请求"""
+        timer = current_timer()
+        if timer is not None:
+            timer.merge(stages)
+
+    def get_model_status(self) -> Dict[str, Any]:
+        """worker 上报的模型状态（进程池启动前为空）"""
+        return dict(self._status)
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+水印去除全流程基准
+
+以合成图片（多种尺寸）与遮罩（角落 logo / 底部横幅 / 分散文字）跑完整的
+WatermarkRemovalService._remove_watermark，分阶段计时：
+
+- decode    : 图片解码
+- mask      : 遮罩 bbox / 推理区域计算
+- prepare   : LaMa 输入张量准备
+- inference : ONNX 推理（含 batch 合并）
+- postprocess / blend : 输出裁剪与羽化融合
+- inpaint   : model.inpaint 总耗时（opencv 路径仅此项）
+- encode    : 输出编码
+- end_to_end: 整体耗时
+
+推理路径：
+- lama       : 单窗口
+- lama_tiled : 多窗口（分块或按连通域拆分，由遮罩形状决定）
+- opencv     : 未加载模型时的 cv2.inpaint 回退
+
+LaMa 使用替身模型（synthetic.build_stub_model），推理耗时不代表真实模型，
+但除推理外的各阶段与真实流程一致，适合在不同提交间对比。
+
+用法（在 backend 目录下执行，需先 pip install -r requirements-dev.txt）:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --sizes 1024x768 --runs 5 --output before.json
+    python benchmarks/bench_pipeline.py --baseline before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from synthetic import IMAGE_SIZES, MASK_SHAPES, build_stub_model, draw_watermark, encode, make_image, make_mask  # noqa: E402
+from aimultibox.core.config import settings  # noqa: E402
+from aimultibox.tools.watermark_removal import service as service_module  # noqa: E402
+from aimultibox.tools.watermark_removal.encoder import EncodeOptions  # noqa: E402
+from aimultibox.tools.watermark_removal.model import WatermarkModel  # noqa: E402
+from aimultibox.tools.watermark_removal.service import WatermarkRemovalService  # noqa: E402
+
+STAGES = ("decode", "mask", "prepare", "inference", "postprocess", "blend", "inpaint", "encode", "end_to_end")
+BACKENDS = ("lama", "opencv")
+
+
+# ==================== 计时 ====================
+
+class StageRecorder:
+    """替换流程中的函数为计时包装，按阶段累计单次运行的耗时（毫秒）"""
+
+    def __init__(self):
+        self.current: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._restore: List[Tuple[Any, str, Any, bool]] = []
+
+    def wrap(self, owner: Any, attr: str, stage: str, after: Optional[Callable[[Any], None]] = None) -> None:
+        original = getattr(owner, attr)
+        had_own = attr in vars(owner)
+
+        if asyncio.iscoroutinefunction(original):
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                result = await original(*args, **kwargs)
+                self._add(stage, start)
+                return result
+        else:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                result = original(*args, **kwargs)
+                if after is not None:
+                    after(result)
+                self._add(stage, start)
+                return result
+
+        setattr(owner, attr, timed)
+        self._restore.append((owner, attr, original, had_own))
+
+    def _add(self, stage: str, start: float) -> None:
+        self.current[stage] += (time.perf_counter() - start) * 1000
+        self.calls[stage] += 1
+
+    def reset(self) -> None:
+        self.current = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def restore(self) -> None:
+        for owner, attr, original, had_own in reversed(self._restore):
+            if had_own:
+                setattr(owner, attr, original)
+            else:
+                delattr(owner, attr)
+        self._restore.clear()
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(sum(samples) / len(samples), 3),
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "p95_ms": round(samples[max(0, int(len(samples) * 0.95) - 1)], 3),
+        "min_ms": round(samples[0], 3),
+    }
+
+
+# ==================== 流程 ====================
+
+def build_service(backend: str, model_path: Path) -> WatermarkRemovalService:
+    """构建不使用缓存、不从 models 目录加载的进程内服务"""
+    model = WatermarkModel()
+    model.mode = "local"
+    model._loaded.set()  # 跳过 models 目录下的模型查找
+    if backend == "lama":
+        if not model.lama.load(model_path):
+            raise RuntimeError("替身模型加载失败（需要 onnx 与 onnxruntime）")
+        model.lama.warmup()
+    service = WatermarkRemovalService(model=model, use_cache=False)
+    service.pool = None
+    return service
+
+
+def instrument(service: WatermarkRemovalService, recorder: StageRecorder) -> None:
+    model = service.model
+    lama = model.lama
+    recorder.wrap(service_module, "open_image", "decode", after=lambda image: image.load())
+    recorder.wrap(service, "_mask_roi", "mask")
+    recorder.wrap(model, "inpaint", "inpaint")
+    recorder.wrap(lama, "_prepare_input", "prepare")
+    recorder.wrap(lama.batcher, "_run_batch", "inference")
+    recorder.wrap(lama, "_process_output", "postprocess")
+    recorder.wrap(lama.blender, "blend", "blend")
+
+
+async def run_case(service: WatermarkRemovalService, recorder: StageRecorder,
+                   image_bytes: bytes, mask_bytes: bytes, options: EncodeOptions,
+                   runs: int, warmup: int) -> Dict[str, Any]:
+    samples: Dict[str, List[float]] = defaultdict(list)
+    windows = 0
+    for i in range(warmup + runs):
+        recorder.reset()
+        start = time.perf_counter()
+        result = await service._remove_watermark(image_bytes, mask_bytes, None, options)
+        elapsed = (time.perf_counter() - start) * 1000
+        if result is None:
+            raise RuntimeError("去除水印失败")
+        if i < warmup:
+            continue
+
+        windows = recorder.calls.get("prepare", 0)
+        for stage in STAGES:
+            if stage in recorder.current:
+                samples[stage].append(recorder.current[stage])
+        samples["encode"].append(result.encode_ms)
+        samples["end_to_end"].append(elapsed)
+
+    return {
+        "windows": windows,
+        "stages": {stage: summarize(samples[stage]) for stage in STAGES if samples.get(stage)},
+    }
+
+
+def parse_size(value: str) -> Tuple[int, int]:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    try:
+        import onnxruntime as ort
+        ort_version = ort.__version__
+    except ImportError:
+        ort_version = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "onnxruntime": ort_version,
+        "batch_size": settings.watermark_batch_size,
+    }
+
+
+async def run(sizes: List[Tuple[int, int]], masks: List[str], backends: List[str],
+              output_format: str, runs: int, warmup: int) -> Dict[str, Any]:
+    results = []
+    options = EncodeOptions(format=output_format)
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = build_stub_model(Path(tmp) / "lama_stub.onnx")
+
+        for backend in backends:
+            service = build_service(backend, model_path)
+            recorder = StageRecorder()
+            instrument(service, recorder)
+            try:
+                for width, height in sizes:
+                    base = make_image(width, height)
+                    for shape in masks:
+                        mask, boxes = make_mask(width, height, shape)
+                        image_bytes = encode(draw_watermark(base, boxes), "JPEG")
+                        mask_bytes = encode(mask)
+
+                        case = await run_case(service, recorder, image_bytes, mask_bytes, options, runs, warmup)
+                        path = backend
+                        if backend == "lama" and case["windows"] > 1:
+                            path = "lama_tiled"
+                        results.append({
+                            "case": f"{backend}/{width}x{height}/{shape}",
+                            "backend": backend,
+                            "path": path,
+                            "size": f"{width}x{height}",
+                            "mask": shape,
+                            **case,
+                        })
+                        print(f"  {results[-1]['case']:40s} {path:10s} "
+                              f"{case['stages']['end_to_end']['mean_ms']:9.1f}ms", file=sys.stderr)
+            finally:
+                recorder.restore()
+
+    return {
+        "benchmark": "pipeline",
+        "runs": runs,
+        "output_format": output_format,
+        "environment": environment(),
+        "results": results,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """按 case 对比 end_to_end 与各阶段均值"""
+    previous = {item["case"]: item for item in baseline.get("results", [])}
+    print(f"对比基线 {baseline.get('environment', {}).get('commit')} -> "
+          f"{report['environment'].get('commit')}")
+    for item in report["results"]:
+        old = previous.get(item["case"])
+        if old is None:
+            continue
+        parts = []
+        for stage in STAGES:
+            if stage in item["stages"] and stage in old["stages"]:
+                before = old["stages"][stage]["mean_ms"]
+                after = item["stages"][stage]["mean_ms"]
+                if before > 0:
+                    parts.append(f"{stage} {after / before:.2f}x")
+        print(f"  {item['case']:40s} " + ", ".join(parts))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="水印去除全流程分阶段基准")
+    parser.add_argument("--sizes", nargs="+", default=[f"{w}x{h}" for w, h in IMAGE_SIZES],
+                        help="图片尺寸，如 1920x1080")
+    parser.add_argument("--masks", nargs="+", choices=MASK_SHAPES, default=list(MASK_SHAPES), help="遮罩形状")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS), help="推理路径")
+    parser.add_argument("--format", default="png", choices=["png", "jpeg", "webp"], help="输出格式")
+    parser.add_argument("--runs", type=int, default=5, help="每个 case 计时次数")
+    parser.add_argument("--warmup", type=int, default=1, help="每个 case 预热次数")
+    parser.add_argument("--output", type=Path, default=None, help="JSON 输出文件（默认输出到 stdout）")
+    parser.add_argument("--baseline", type=Path, default=None, help="与之前的 JSON 结果对比")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(
+        [parse_size(size) for size in args.sizes], args.masks, args.backends,
+        args.format, args.runs, args.warmup,
+    ))
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+    elif not args.baseline:
+        print(text)
+
+    if args.baseline:
+        compare(report, json.loads(args.baseline.read_text(encoding="utf-8")))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
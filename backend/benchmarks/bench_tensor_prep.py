@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+LaMa 输入预处理 / 输出后处理微基准
+
+对比旧实现（np.pad + astype + 除法 + transpose）与当前实现（写入复用缓冲）：
+- 512x512 分块（无需填充）
+- 边缘分块（需要反射填充）
+
+旧实现返回的是转置视图，送入 onnxruntime / 合并 batch 时还会再做一次连续化复制，计时中一并计入
+
+用法（在 backend 目录下执行）:
+    python benchmarks/bench_tensor_prep.py
+    python benchmarks/bench_tensor_prep.py --runs 500 --json
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aimultibox.tools.watermark_removal.model import LaMaInpainter  # noqa: E402
+
+INPUT_SIZE = 512
+TILE_SHAPES = [(512, 512), (300, 400), (512, 137)]
+
+
+# ==================== 旧实现（对照） ====================
+
+def legacy_prepare_input(img_crop: np.ndarray, mask_crop: np.ndarray) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+    h, w = img_crop.shape[:2]
+
+    if h == INPUT_SIZE and w == INPUT_SIZE:
+        img_norm = img_crop.astype(np.float32) / 255.0
+        mask_norm = (mask_crop > 127).astype(np.float32)
+        img_tensor = np.transpose(img_norm, (2, 0, 1))[np.newaxis, ...]
+        mask_tensor = mask_norm[np.newaxis, np.newaxis, ...]
+        return img_tensor, mask_tensor, (h, w)
+
+    pad_h = INPUT_SIZE - h
+    pad_w = INPUT_SIZE - w
+    img_padded = np.pad(img_crop, ((0, pad_h), (0, pad_w), (0, 0)), mode='reflect')
+    mask_padded = np.pad(mask_crop, ((0, pad_h), (0, pad_w)), mode='constant', constant_values=0)
+    img_norm = img_padded.astype(np.float32) / 255.0
+    mask_norm = (mask_padded > 127).astype(np.float32)
+    img_tensor = np.transpose(img_norm, (2, 0, 1))[np.newaxis, ...]
+    mask_tensor = mask_norm[np.newaxis, np.newaxis, ...]
+    return img_tensor, mask_tensor, (h, w)
+
+
+def legacy_prepare_contiguous(img_crop: np.ndarray, mask_crop: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """旧实现 + 推理前的连续化复制"""
+    img_tensor, mask_tensor, _ = legacy_prepare_input(img_crop, mask_crop)
+    return np.ascontiguousarray(img_tensor), np.ascontiguousarray(mask_tensor)
+
+
+def legacy_process_output(output: np.ndarray, crop_size: Tuple[int, int]) -> np.ndarray:
+    result = np.transpose(output[0], (1, 2, 0))
+    h, w = crop_size
+    return np.clip(result[:h, :w, :], 0, 255).astype(np.uint8)
+
+
+# ==================== 计时 ====================
+
+def measure(func: Callable[[], object], runs: int) -> Dict[str, float]:
+    """返回耗时统计（毫秒）"""
+    for _ in range(min(10, runs)):
+        func()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": round(sum(samples) / len(samples), 4),
+        "p50_ms": round(samples[len(samples) // 2], 4),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 4),
+    }
+
+
+def run(runs: int) -> Dict[str, object]:
+    rng = np.random.default_rng(0)
+    lama = LaMaInpainter()
+    # 模拟从整图中裁剪的非连续视图
+    image = rng.integers(0, 256, (1024, 1024, 3), dtype=np.uint8)
+    mask = (rng.random((1024, 1024)) > 0.8).astype(np.uint8) * 255
+    output = (rng.random((1, 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32) * 300 - 20)
+
+    results = {}
+    for h, w in TILE_SHAPES:
+        img_crop = image[100:100 + h, 200:200 + w]
+        mask_crop = mask[100:100 + h, 200:200 + w]
+
+        # 校验两种实现结果一致
+        old = legacy_prepare_input(img_crop, mask_crop)
+        new = lama._prepare_input(img_crop, mask_crop)
+        assert np.array_equal(old[0], new[0]) and np.array_equal(old[1], new[1])
+        assert np.array_equal(legacy_process_output(output, (h, w)), lama._process_output(output, (h, w)))
+        lama._tensor_pool.release(new[0], new[1])
+
+        def prepare_new() -> None:
+            img_tensor, mask_tensor, _ = lama._prepare_input(img_crop, mask_crop)
+            lama._tensor_pool.release(img_tensor, mask_tensor)  # 推理完成后归还（同 _run_batch）
+
+        key = f"{h}x{w}"
+        results[key] = {
+            "prepare_legacy": measure(lambda: legacy_prepare_contiguous(img_crop, mask_crop), runs),
+            "prepare": measure(prepare_new, runs),
+            "process_output_legacy": measure(lambda: legacy_process_output(output, (h, w)), runs),
+            "process_output": measure(lambda: lama._process_output(output, (h, w)), runs),
+        }
+    return {"benchmark": "tensor_prep", "runs": runs, "numpy": np.__version__, "results": results}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="LaMa 张量预处理 / 后处理微基准")
+    parser.add_argument("--runs", type=int, default=200, help="每项计时次数")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    report = run(args.runs)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    for shape, stages in report["results"].items():
+        print(f"[{shape}]")
+        for stage in ("prepare", "process_output"):
+            legacy = stages[f"{stage}_legacy"]["mean_ms"]
+            current = stages[stage]["mean_ms"]
+            print(f"  {stage:15s} legacy {legacy:7.3f}ms  current {current:7.3f}ms  ({legacy / current:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
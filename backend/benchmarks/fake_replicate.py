@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+本地模拟的 Replicate 预测 API（测试 / 基准用）
+
+- POST /v1/predictions        : 创建预测，支持 Prefer: wait=N（处理完成或等待超时后返回）
+- GET  /v1/predictions/{id}   : 查询预测状态
+- GET  /files/{id}.png        : 输出图片（原样返回输入图片，仅用于验证流程）
+- GET  /stats                 : 各接口请求计数
+
+每个预测在创建 --latency 秒后变为 succeeded
+
+用法（在 backend 目录下执行）:
+    # 独立服务（需要 uvicorn），后端指向本地服务
+    python benchmarks/fake_replicate.py --serve --port 8765 --latency 3
+    AI_MODE=cloud REPLICATE_API_TOKEN=fake REPLICATE_BASE_URL=http://127.0.0.1:8765/v1 python run.py
+
+    # 进程内基准：对比旧实现（每次新建客户端、每秒轮询）与 SDXLInpainter
+    python benchmarks/fake_replicate.py --bench --jobs 8 --latency 2
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import sys
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi import FastAPI, HTTPException, Request, Response  # noqa: E402
+
+
+def create_app(latency: float = 2.0) -> FastAPI:
+    app = FastAPI(title="Fake Replicate")
+    predictions: Dict[str, Dict[str, Any]] = {}
+    app.state.stats = Counter()
+
+    def view(request: Request, prediction: Dict[str, Any]) -> Dict[str, Any]:
+        done = time.monotonic() - prediction["created"] >= latency
+        base = str(request.base_url).rstrip("/")
+        return {
+            "id": prediction["id"],
+            "status": "succeeded" if done else "processing",
+            "output": [f"{base}/files/{prediction['id']}.png"] if done else None,
+            "error": None,
+            "urls": {"get": f"{base}/v1/predictions/{prediction['id']}"},
+        }
+
+    @app.post("/v1/predictions", status_code=201)
+    async def create_prediction(request: Request) -> Dict[str, Any]:
+        app.state.stats["create"] += 1
+        body = await request.json()
+        data_uri = body["input"]["image"]
+        prediction = {
+            "id": uuid.uuid4().hex,
+            "created": time.monotonic(),
+            "image": base64.b64decode(data_uri.split(",", 1)[1]),
+        }
+        predictions[prediction["id"]] = prediction
+
+        prefer = request.headers.get("prefer", "")
+        if prefer.startswith("wait"):
+            wait = float(prefer.partition("=")[2] or 60)
+            await asyncio.sleep(max(0.0, min(wait, latency)))
+        return view(request, prediction)
+
+    @app.get("/v1/predictions/{prediction_id}")
+    async def get_prediction(prediction_id: str, request: Request) -> Dict[str, Any]:
+        app.state.stats["poll"] += 1
+        prediction = predictions.get(prediction_id)
+        if prediction is None:
+            raise HTTPException(status_code=404, detail="not found")
+        return view(request, prediction)
+
+    @app.get("/files/{prediction_id}.png")
+    async def get_file(prediction_id: str) -> Response:
+        app.state.stats["download"] += 1
+        prediction = predictions.get(prediction_id)
+        if prediction is None:
+            raise HTTPException(status_code=404, detail="not found")
+        return Response(prediction["image"], media_type="image/png")
+
+    @app.get("/stats")
+    async def stats() -> Dict[str, int]:
+        return dict(app.state.stats)
+
+    return app
+
+
+# ==================== 基准 ====================
+
+async def legacy_inpaint(transport: Any, base_url: str, image_uri: str) -> Optional[bytes]:
+    """旧实现的请求模式：每次新建客户端，每秒轮询一次"""
+    import httpx
+
+    async with httpx.AsyncClient(transport=transport, timeout=180) as client:
+        response = await client.post(f"{base_url}/predictions", json={"input": {"image": image_uri, "mask": image_uri}})
+        prediction_id = response.json()["id"]
+        for _ in range(90):
+            await asyncio.sleep(1)
+            status = (await client.get(f"{base_url}/predictions/{prediction_id}")).json()
+            if status["status"] == "succeeded":
+                return (await client.get(status["output"][0])).content
+    return None
+
+
+async def bench(jobs: int, latency: float, wait_seconds: int) -> Dict[str, Any]:
+    import httpx
+    from PIL import Image
+    from aimultibox.core.config import settings
+    from aimultibox.tools.watermark_removal.model import SDXLInpainter
+
+    image = Image.new("RGB", (512, 512), (120, 140, 160))
+    mask = Image.new("L", (512, 512), 0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    image_uri = f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}"
+    base_url = "http://fake-replicate/v1"
+
+    async def run(label: str, app: Any, call) -> Dict[str, Any]:
+        transport = httpx.ASGITransport(app=app)
+        elapsed: List[float] = []
+
+        async def one() -> None:
+            start = time.perf_counter()
+            assert await call(transport) is not None
+            elapsed.append(time.perf_counter() - start)
+
+        await asyncio.gather(*[one() for _ in range(jobs)])
+        elapsed.sort()
+        stats = dict(app.state.stats)
+        return {
+            "variant": label,
+            "mean_s": round(sum(elapsed) / len(elapsed), 3),
+            "max_s": round(elapsed[-1], 3),
+            "polls_per_job": round(stats.get("poll", 0) / jobs, 2),
+            "requests": sum(stats.values()),
+        }
+
+    settings.replicate_wait_seconds = wait_seconds
+    results = [await run("legacy", create_app(latency), lambda t: legacy_inpaint(t, base_url, image_uri))]
+
+    # 所有并发任务共用一个提前创建的实例，首次请求时会同时进入 _get_client
+    app = create_app(latency)
+    inpainter = SDXLInpainter("fake", base_url=base_url, transport=httpx.ASGITransport(app=app))
+    results.append(await run("current", app, lambda _: inpainter.inpaint(image, mask)))
+    await inpainter.close()
+    return {"benchmark": "replicate_client", "jobs": jobs, "latency_s": latency,
+            "wait_seconds": wait_seconds, "results": results}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="本地模拟 Replicate API")
+    parser.add_argument("--serve", action="store_true", help="启动 HTTP 服务（需要 uvicorn）")
+    parser.add_argument("--bench", action="store_true", help="进程内基准")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=2.0, help="预测处理耗时（秒）")
+    parser.add_argument("--jobs", type=int, default=8, help="基准并发预测数")
+    parser.add_argument("--wait-seconds", type=int, default=30, help="基准中 Prefer: wait 秒数（0 为仅轮询）")
+    args = parser.parse_args()
+
+    if args.serve:
+        import uvicorn
+        uvicorn.run(create_app(args.latency), host=args.host, port=args.port)
+        return 0
+    if args.bench:
+        print(json.dumps(asyncio.run(bench(args.jobs, args.latency, args.wait_seconds)), indent=2))
+        return 0
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试用的合成数据
+
+- 合成图片：渐变背景 + 色块 + 轻微噪声，带绘制上去的“水印”
+- 遮罩形状：角落 logo、底部横幅、分散文字
+- 替身 ONNX 模型：与 LaMa 输入输出一致（image / mask -> output，动态 batch），
+  两层 3x3 卷积，无需下载真实权重（需要 onnx: pip install -r requirements-dev.txt）
+"""
+
+import io
+from pathlib import Path
+from typing import Dict, Callable, List, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZES: List[Tuple[int, int]] = [(1024, 768), (1920, 1080), (4000, 3000)]
+MASK_SHAPES = ("corner_logo", "banner", "scattered_text")
+
+
+def make_image(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """合成 RGB 图片（HWC uint8）"""
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.stack([
+        120 + 80 * np.sin(xs / width * 3.1),
+        100 + 60 * np.cos(ys / height * 2.3),
+        140 + 50 * np.sin((xs + ys) / (width + height) * 5.0),
+    ], axis=-1)
+
+    for _ in range(12):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        radius = int(rng.integers(min(width, height) // 30, min(width, height) // 6))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.circle(image, (x, y), radius, color, -1)
+
+    image += rng.normal(0, 4, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def _corner_logo(width: int, height: int, rng: np.random.Generator) -> List[Tuple[int, int, int, int]]:
+    w, h = int(width * 0.12), int(height * 0.06)
+    margin = int(min(width, height) * 0.02)
+    return [(width - w - margin, height - h - margin, w, h)]
+
+
+def _banner(width: int, height: int, rng: np.random.Generator) -> List[Tuple[int, int, int, int]]:
+    h = int(height * 0.08)
+    return [(0, height - h - int(height * 0.03), width, h)]
+
+
+def _scattered_text(width: int, height: int, rng: np.random.Generator) -> List[Tuple[int, int, int, int]]:
+    boxes = []
+    scale = min(width, height) / 1000
+    for _ in range(10):
+        w, h = int(150 * scale), int(30 * scale)
+        boxes.append((int(rng.integers(0, width - w)), int(rng.integers(0, height - h)), w, h))
+    return boxes
+
+
+_MASK_BUILDERS: Dict[str, Callable[[int, int, np.random.Generator], List[Tuple[int, int, int, int]]]] = {
+    "corner_logo": _corner_logo,
+    "banner": _banner,
+    "scattered_text": _scattered_text,
+}
+
+
+def make_mask(width: int, height: int, shape: str, seed: int = 0) -> Tuple[np.ndarray, List[Tuple[int, int, int, int]]]:
+    """生成遮罩（HW uint8）与对应的水印框"""
+    rng = np.random.default_rng(seed)
+    boxes = _MASK_BUILDERS[shape](width, height, rng)
+    mask = np.zeros((height, width), dtype=np.uint8)
+    for x, y, w, h in boxes:
+        mask[y:y + h, x:x + w] = 255
+    return mask, boxes
+
+
+def draw_watermark(image: np.ndarray, boxes: List[Tuple[int, int, int, int]]) -> np.ndarray:
+    """在水印框内绘制半透明文字"""
+    overlay = image.copy()
+    for x, y, w, h in boxes:
+        scale = max(0.4, h / 40)
+        cv2.putText(overlay, "WATERMARK", (x, y + h - max(2, h // 5)),
+                    cv2.FONT_HERSHEY_SIMPLEX, scale, (255, 255, 255), max(1, h // 15))
+    return cv2.addWeighted(overlay, 0.6, image, 0.4, 0)
+
+
+def encode(array: np.ndarray, fmt: str = "PNG") -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def build_stub_model(path: Path, size: int = 512) -> Path:
+    """生成替身 LaMa 模型（两层卷积，输出 0-255）"""
+    import onnx
+    from onnx import helper, numpy_helper, TensorProto
+
+    rng = np.random.default_rng(0)
+    initializers = [
+        numpy_helper.from_array((rng.standard_normal((16, 4, 3, 3)) * 0.2).astype(np.float32), "w1"),
+        numpy_helper.from_array(np.zeros(16, dtype=np.float32), "b1"),
+        numpy_helper.from_array((rng.standard_normal((3, 16, 3, 3)) * 0.1).astype(np.float32), "w2"),
+        numpy_helper.from_array(np.zeros(3, dtype=np.float32), "b2"),
+        numpy_helper.from_array(np.array(255, dtype=np.float32), "scale"),
+    ]
+    nodes = [
+        helper.make_node("Concat", ["image", "mask"], ["x"], axis=1),
+        helper.make_node("Conv", ["x", "w1", "b1"], ["h"], pads=[1, 1, 1, 1]),
+        helper.make_node("Relu", ["h"], ["r"]),
+        helper.make_node("Conv", ["r", "w2", "b2"], ["o"], pads=[1, 1, 1, 1]),
+        helper.make_node("Sigmoid", ["o"], ["s"]),
+        helper.make_node("Mul", ["s", "scale"], ["output"]),
+    ]
+    graph = helper.make_graph(
+        nodes, "lama_stub",
+        [
+            helper.make_tensor_value_info("image", TensorProto.FLOAT, ["batch", 3, size, size]),
+            helper.make_tensor_value_info("mask", TensorProto.FLOAT, ["batch", 1, size, size]),
+        ],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["batch", 3, size, size])],
+        initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    path.parent.mkdir(parents=True, exist_ok=True)
+    onnx.save(model, str(path))
+    return path
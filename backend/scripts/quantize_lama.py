@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+LaMa 模型变体生成（离线执行）
+
+由 models/lama_fp32.onnx 生成：
+- lama_int8.onnx : onnxruntime 动态量化（权重 int8，激活运行时量化），CPU 推理更快、内存更小
+- lama_fp16.onnx : 半精度权重（输入输出保持 float32），适合 GPU
+
+依赖 onnx（不在运行时依赖中）: pip install -r requirements-dev.txt
+
+用法（在 backend 目录下执行）:
+    python scripts/quantize_lama.py                 # 生成全部变体
+    python scripts/quantize_lama.py --int8
+    python scripts/quantize_lama.py --fp16 --output-dir models
+
+生成后设置 WATERMARK_MODEL_VARIANT=int8 / fp16，或 auto 自动选择达标的最快变体
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_INPUT = BACKEND_DIR / "models" / "lama_fp32.onnx"
+
+
+def quantize_int8(src: Path, dst: Path, per_channel: bool) -> None:
+    """动态量化（Conv / MatMul 权重转为 int8）"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = Path(tmp) / "prepared.onnx"
+        try:
+            # 预处理（形状推导 + 图优化）可提高量化覆盖率；LaMa 为卷积网络，无需符号形状推导
+            quant_pre_process(str(src), str(prepared), skip_symbolic_shape=True)
+        except Exception as e:
+            print(f"  预处理失败，直接量化原模型: {e}")
+            prepared = src
+
+        quantize_dynamic(
+            str(prepared),
+            str(dst),
+            weight_type=QuantType.QInt8,
+            per_channel=per_channel,
+        )
+
+
+def convert_fp16(src: Path, dst: Path) -> None:
+    """转换为半精度（保留 float32 输入输出，调用方无需改动）"""
+    import onnx
+    from onnxruntime.transformers.float16 import convert_float_to_float16
+
+    model = onnx.load(str(src))
+    model = convert_float_to_float16(model, keep_io_types=True)
+    onnx.save(model, str(dst))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="生成 LaMa int8 / fp16 模型变体")
+    parser.add_argument("--input", type=Path, default=DEFAULT_INPUT, help="fp32 模型路径")
+    parser.add_argument("--output-dir", type=Path, default=None, help="输出目录（默认与输入相同）")
+    parser.add_argument("--int8", action="store_true", help="生成 int8 动态量化模型")
+    parser.add_argument("--fp16", action="store_true", help="生成 fp16 模型")
+    parser.add_argument("--per-channel", action="store_true", help="int8 按通道量化（精度更高，稍慢）")
+    args = parser.parse_args()
+
+    if not args.input.exists():
+        print(f"模型文件不存在: {args.input}")
+        return 1
+
+    output_dir = args.output_dir or args.input.parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    targets = []
+    if args.int8 or not args.fp16:
+        targets.append(("int8", output_dir / "lama_int8.onnx", lambda s, d: quantize_int8(s, d, args.per_channel)))
+    if args.fp16 or not args.int8:
+        targets.append(("fp16", output_dir / "lama_fp16.onnx", convert_fp16))
+
+    src_size = args.input.stat().st_size
+    for name, dst, convert in targets:
+        print(f"生成 {name}: {dst}")
+        start = time.perf_counter()
+        try:
+            convert(args.input, dst)
+        except ImportError as e:
+            print(f"  缺少依赖: {e}（pip install -r requirements-dev.txt）")
+            return 1
+        size = dst.stat().st_size
+        print(f"  完成，耗时 {time.perf_counter() - start:.1f}s，"
+              f"大小 {size / 1024 / 1024:.1f}MB（fp32 的 {size / src_size:.0%}）")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
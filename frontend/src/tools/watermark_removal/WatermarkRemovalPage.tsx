@@ -209,7 +209,7 @@ export default function WatermarkRemovalPage() {
       }
       
       if (result.image_base64) {
-        const processedImageData = `data:image/png;base64,${result.image_base64}`
+        const processedImageData = `data:image/${result.format ?? 'png'};base64,${result.image_base64}`
         
         setCurrentState(prev => ({
           ...prev,
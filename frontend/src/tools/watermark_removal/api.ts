@@ -5,6 +5,8 @@ import { apiClient as api } from '@/config/api'
 /** 水印去除结果 */
 export interface WatermarkRemovalResult {
   image_base64?: string
+  /** 输出格式：png / webp / jpeg */
+  format?: string
 }
 
 /** 水印区域 */